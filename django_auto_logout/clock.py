@@ -0,0 +1,93 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Union
+from django.utils import timezone
+
+
+def _to_seconds(seconds: Union[int, float, timedelta]) -> float:
+    return seconds.total_seconds() if isinstance(seconds, timedelta) else seconds
+
+
+class Clock:
+    """
+    The time source of auto logout, see `AUTO_LOGOUT['CLOCK']` and `override_clock`.
+    """
+
+    def now(self) -> datetime:
+        """
+        :return: datetime - aware, if `USE_TZ` is enabled
+        """
+        return timezone.now()
+
+
+class VirtualClock(Clock):
+    """
+    Time that moves only with `advance` and `set`: for simulations and replays.
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self._now = timezone.now() if start is None else start
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def set(self, current_time: datetime) -> None:
+        self._now = current_time
+
+    def advance(self, seconds: Union[int, float, timedelta]) -> None:
+        with self._lock:
+            self._now += timedelta(seconds=_to_seconds(seconds))
+
+
+class OffsetClock(Clock):
+    """
+    The system time shifted by `advance`: a replacement of `sleep` in tests.
+    Django still sets `last_login` and other timestamps in the system time.
+    """
+
+    def __init__(self, offset: Union[int, float, timedelta] = 0):
+        self._offset = timedelta(seconds=_to_seconds(offset))
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        return timezone.now() + self._offset
+
+    def advance(self, seconds: Union[int, float, timedelta]) -> None:
+        with self._lock:
+            self._offset += timedelta(seconds=_to_seconds(seconds))
+
+
+system_clock = Clock()
+
+# Clocks of `override_clock`, the last one is used.
+_overrides = []
+
+
+def get_clock() -> Clock:
+    """
+    :return: Clock - of `override_clock`, `AUTO_LOGOUT['CLOCK']` or the system one
+    """
+    if _overrides:
+        return _overrides[-1]
+
+    from .conf import get_config  # conf imports the clock
+
+    config = get_config()
+    return system_clock if config is None else config.clock
+
+
+@contextmanager
+def override_clock(clock: Clock) -> Iterator[Clock]:
+    """
+    Use the clock for auto logout in the block (or the decorated function) in all threads.
+
+        with override_clock(OffsetClock()) as clock:
+            clock.advance(IDLE_TIME)
+    """
+    _overrides.append(clock)
+    try:
+        yield clock
+    finally:
+        _overrides.remove(clock)
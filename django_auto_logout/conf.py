@@ -0,0 +1,424 @@
+import re
+from datetime import timedelta
+from typing import Any, Callable, Hashable, Optional, Type, Union
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+from .clock import Clock, system_clock
+from .deadlines import DeadlineCache
+from .metrics import MetricsExporter, MultiExporter, metrics
+from .policies import PolicyCache
+from .stores import ActivityStore, SessionActivityStore
+from .utils import idle_time_to_timedelta, now, session_time_to_timedelta
+
+
+def _get_exclude_matcher(options: dict) -> Optional[Callable[[HttpRequest], bool]]:
+    """
+    Build a function to check if the request is excluded from auto logout,
+    so neither the user nor the session are loaded for it.
+    `EXCLUDE_PATHS` are path prefixes, `EXCLUDE_URL_NAMES` are URL names (with namespaces).
+    """
+    paths = options.get('EXCLUDE_PATHS')
+    url_names = frozenset(options.get('EXCLUDE_URL_NAMES') or ())
+    if not paths and not url_names:
+        return None
+
+    # One regex for all the prefixes: a single `match` call per request.
+    paths_re = re.compile('|'.join(re.escape(path) for path in paths)) if paths else None
+
+    def is_excluded(request: HttpRequest) -> bool:
+        if paths_re is not None and paths_re.match(request.path_info):
+            return True
+
+        if url_names:
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return False
+            return match.url_name in url_names or match.view_name in url_names
+
+        return False
+
+    return is_excluded
+
+
+_FALSY_HEADER_VALUES = frozenset(('', '0', 'false', 'no', 'off'))
+
+
+def _get_passive_matcher(options: dict) -> Callable[[HttpRequest], bool]:
+    """
+    Build a function to check if the request isn't activity: it's checked, but doesn't refresh the idle time.
+    The request is passive if it has one of `PASSIVE_HEADERS` (and `X-Auto-Logout-Passive`)
+    with a value other than "", "0", "false", "no" or "off",
+    one of `PASSIVE_METHODS`, one of `PASSIVE_URL_NAMES` or `PASSIVE_FUNC(request)` returns True.
+    """
+    headers = ['X-Auto-Logout-Passive', *(options.get('PASSIVE_HEADERS') or ())]
+    meta_keys = tuple(dict.fromkeys('HTTP_' + header.upper().replace('-', '_') for header in headers))
+    methods = frozenset(method.upper() for method in options.get('PASSIVE_METHODS') or ())
+    url_names = frozenset(options.get('PASSIVE_URL_NAMES') or ())
+
+    func = options.get('PASSIVE_FUNC')
+    if isinstance(func, str):
+        func = import_string(func)
+    if func is not None and not callable(func):
+        raise ImproperlyConfigured("PASSIVE_FUNC should be a function")
+
+    def is_passive(request: HttpRequest) -> bool:
+        meta = request.META
+        for key in meta_keys:
+            value = meta.get(key)
+            if value is not None and value.strip().lower() not in _FALSY_HEADER_VALUES:
+                return True
+
+        if request.method in methods:
+            return True
+
+        if url_names:
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                pass
+            else:
+                if match.url_name in url_names or match.view_name in url_names:
+                    return True
+
+        return func is not None and bool(func(request))
+
+    return is_passive
+
+
+def _get_logout_func(options: dict) -> Optional[Callable]:
+    logout_func = options.get('CUSTOM_LOGOUT_FUNC')
+    if logout_func is None:
+        return None
+
+    if isinstance(logout_func, str):
+        logout_func = import_string(logout_func)
+
+    if not callable(logout_func):
+        raise ImproperlyConfigured("CUSTOM_LOGOUT_FUNC should be a function")
+
+    return logout_func
+
+
+def _get_policy_resolver(options: dict) -> Optional[Callable]:
+    resolver = options.get('POLICY_RESOLVER')
+    if resolver is None:
+        return None
+
+    if isinstance(resolver, str):
+        resolver = import_string(resolver)
+
+    if not callable(resolver):
+        raise ImproperlyConfigured("POLICY_RESOLVER should be a function")
+
+    return resolver
+
+
+def _get_group_policies(options: dict) -> dict:
+    policies = options.get('GROUP_POLICIES')
+    if policies is None:
+        return {}
+    if not isinstance(policies, dict) or not all(isinstance(policy, dict) for policy in policies.values()):
+        raise ImproperlyConfigured("GROUP_POLICIES should be a dict of policies")
+
+    return policies
+
+
+def _freeze(value: Any) -> Hashable:
+    """
+    Make the options of a policy hashable, e.g. `{'PASSIVE_METHODS': ['HEAD']}`.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _get_timestamp_format(options: dict) -> str:
+    timestamp_format = options.get('TIMESTAMP_FORMAT', 'iso')
+    if timestamp_format not in ('iso', 'seconds', 'deciseconds'):
+        raise ImproperlyConfigured("TIMESTAMP_FORMAT should be 'iso', 'seconds' or 'deciseconds'")
+
+    return timestamp_format
+
+
+def _get_write_guard(options: dict) -> bool:
+    write_guard = bool(options.get('ACTIVITY_WRITE_GUARD'))
+    if write_guard and not options.get('IDLE_TIME_RESOLUTION'):
+        raise ImproperlyConfigured("ACTIVITY_WRITE_GUARD needs IDLE_TIME_RESOLUTION")
+
+    return write_guard
+
+
+def _get_client_script(options: dict) -> str:
+    client_script = options.get('CLIENT_SCRIPT', 'inline')
+    if client_script not in ('inline', 'static'):
+        raise ImproperlyConfigured("CLIENT_SCRIPT should be 'inline' or 'static'")
+
+    return client_script
+
+
+def _get_client_coordination(options: dict) -> str:
+    coordination = options.get('CLIENT_COORDINATION', 'tab')
+    if coordination not in ('tab', 'leader'):
+        raise ImproperlyConfigured("CLIENT_COORDINATION should be 'tab' or 'leader'")
+    if coordination == 'leader' and options.get('CLIENT_SCRIPT', 'inline') != 'static':
+        raise ImproperlyConfigured("CLIENT_COORDINATION 'leader' needs CLIENT_SCRIPT 'static'")
+
+    return coordination
+
+
+def _get_client_heartbeat(options: dict) -> Optional[timedelta]:
+    heartbeat = options.get('CLIENT_HEARTBEAT')
+    if heartbeat is None:
+        return None
+    if options.get('CLIENT_SCRIPT', 'inline') != 'static':
+        raise ImproperlyConfigured("CLIENT_HEARTBEAT needs CLIENT_SCRIPT 'static'")
+
+    return idle_time_to_timedelta(heartbeat, 'CLIENT_HEARTBEAT')
+
+
+def _get_logout_retry_after(options: dict) -> Optional[int]:
+    retry_after = options.get('LOGOUT_RETRY_AFTER')
+    if retry_after is None:
+        return None
+
+    return int(idle_time_to_timedelta(retry_after, 'LOGOUT_RETRY_AFTER').total_seconds())
+
+
+def _get_metrics(options: dict) -> Optional[MetricsExporter]:
+    exporters = options.get('METRICS_EXPORTERS') or ()
+    if not options.get('METRICS') and not exporters:
+        return None
+
+    built = [metrics]
+    for exporter in exporters:
+        if isinstance(exporter, str):
+            exporter = import_string(exporter)
+        if isinstance(exporter, type) and issubclass(exporter, MetricsExporter):
+            exporter = exporter()
+        if not isinstance(exporter, MetricsExporter):
+            raise ImproperlyConfigured(
+                "METRICS_EXPORTERS should be subclasses or instances of django_auto_logout.metrics.MetricsExporter"
+            )
+        built.append(exporter)
+
+    return MultiExporter(built) if len(built) > 1 else metrics
+
+
+def _get_clock(options: dict) -> Clock:
+    clock = options.get('CLOCK')
+    if clock is None:
+        return system_clock
+
+    if isinstance(clock, str):
+        clock = import_string(clock)
+    if isinstance(clock, type) and issubclass(clock, Clock):
+        clock = clock()
+    if not isinstance(clock, Clock):
+        raise ImproperlyConfigured("CLOCK should be a subclass or an instance of django_auto_logout.clock.Clock")
+
+    return clock
+
+
+def _get_deadline_cache(options: dict) -> Optional[DeadlineCache]:
+    size = options.get('DEADLINE_CACHE_SIZE')
+    if not size:
+        return None
+    if not isinstance(size, int):
+        raise ImproperlyConfigured("DEADLINE_CACHE_SIZE should be a number of sessions")
+    # Without the resolution every request stores the activity, so there is nothing to skip.
+    if 'IDLE_TIME' in options and not options.get('IDLE_TIME_RESOLUTION'):
+        raise ImproperlyConfigured("DEADLINE_CACHE_SIZE with IDLE_TIME needs IDLE_TIME_RESOLUTION")
+
+    return DeadlineCache(size)
+
+
+def _get_activity_store(options: dict) -> Type[ActivityStore]:
+    store = options.get('ACTIVITY_STORE', SessionActivityStore)
+    if isinstance(store, str):
+        store = import_string(store)
+
+    if not (isinstance(store, type) and issubclass(store, ActivityStore)):
+        raise ImproperlyConfigured("ACTIVITY_STORE should be a subclass of django_auto_logout.stores.ActivityStore")
+
+    return store
+
+
+class AutoLogoutConfig:
+    """
+    Validated `AUTO_LOGOUT` settings.
+    Built once by `get_config`, so requests don't check and convert the settings again.
+    """
+    __slots__ = (
+        'options',
+        'session_time',
+        'idle_time',
+        'idle_time_resolution',
+        'timestamp_format',
+        'store_login_time',
+        'write_guard',
+        'push_events',
+        'redirect_to_login_immediately',
+        'client_script',
+        'client_coordination',
+        'client_jitter',
+        'client_heartbeat',
+        'logout_retry_after',
+        'logout_func',
+        'is_excluded',
+        'is_passive',
+        'policy_resolver',
+        'policy_cache',
+        'policies',
+        'metrics',
+        'clock',
+        'deadline_cache',
+        'activity_store',
+    )
+
+    options: dict
+    session_time: Optional[timedelta]
+    idle_time: Optional[timedelta]
+    idle_time_resolution: Optional[timedelta]
+    timestamp_format: str
+    store_login_time: bool
+    write_guard: bool
+    push_events: bool
+    redirect_to_login_immediately: bool
+    client_script: str
+    client_coordination: str
+    client_jitter: Optional[timedelta]
+    client_heartbeat: Optional[timedelta]
+    logout_retry_after: Optional[int]
+    logout_func: Optional[Callable]
+    is_excluded: Optional[Callable[[HttpRequest], bool]]
+    is_passive: Callable[[HttpRequest], bool]
+    policy_resolver: Optional[Callable]
+    policy_cache: Optional[PolicyCache]
+    policies: dict
+    metrics: Optional[MetricsExporter]
+    clock: Clock
+    deadline_cache: Optional[DeadlineCache]
+    activity_store: ActivityStore
+
+    def __init__(self, options: dict, parent: Optional['AutoLogoutConfig'] = None):
+        resolution = options.get('IDLE_TIME_RESOLUTION')
+        values = {
+            # `CUSTOM_LOGOUT_FUNC(request, options)` still gets the original settings.
+            'options': options,
+            'session_time': session_time_to_timedelta(options['SESSION_TIME']) if 'SESSION_TIME' in options else None,
+            'idle_time': idle_time_to_timedelta(options['IDLE_TIME']) if 'IDLE_TIME' in options else None,
+            'idle_time_resolution': (
+                idle_time_to_timedelta(resolution, 'IDLE_TIME_RESOLUTION') if resolution else None
+            ),
+            'timestamp_format': _get_timestamp_format(options),
+            'store_login_time': bool(options.get('STORE_LOGIN_TIME')),
+            'write_guard': _get_write_guard(options),
+            'push_events': bool(options.get('PUSH_EVENTS')),
+            'redirect_to_login_immediately': bool(options.get('REDIRECT_TO_LOGIN_IMMEDIATELY')),
+            'client_script': _get_client_script(options),
+            'client_coordination': _get_client_coordination(options),
+            'client_jitter': (
+                idle_time_to_timedelta(options['CLIENT_JITTER'], 'CLIENT_JITTER')
+                if options.get('CLIENT_JITTER') else None
+            ),
+            'client_heartbeat': _get_client_heartbeat(options),
+            'logout_retry_after': _get_logout_retry_after(options),
+            'logout_func': _get_logout_func(options),
+            'is_excluded': _get_exclude_matcher(options),
+            'is_passive': _get_passive_matcher(options),
+            'policy_resolver': _get_policy_resolver(options),
+            'policies': {},
+            # Configs of policies share the exporters.
+            'metrics': parent.metrics if parent is not None else _get_metrics(options),
+            'clock': parent.clock if parent is not None else _get_clock(options),
+            'deadline_cache': parent.deadline_cache if parent is not None else _get_deadline_cache(options),
+        }
+        values['policy_cache'] = PolicyCache(
+            options.get('POLICY_CACHE_SIZE', 10000), options.get('POLICY_CACHE_TTL', 300),
+        ) if values['policy_resolver'] else None
+
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+        # The store is built with the rest of the config.
+        object.__setattr__(self, 'activity_store', _get_activity_store(options)(self))
+
+        # `GROUP_POLICIES` are built (and checked) with the settings, not at the first request of a user.
+        if parent is None:
+            for name, policy in _get_group_policies(options).items():
+                self.policies[name] = self._build_policy(policy)
+
+    def _build_policy(self, policy: dict) -> 'AutoLogoutConfig':
+        options = {**self.options, **policy}
+        options.pop('POLICY_RESOLVER', None)
+        return AutoLogoutConfig(options, self)
+
+    def with_policy(self, policy: Union[str, dict]) -> 'AutoLogoutConfig':
+        """
+        Get the config with the options of the policy (see `POLICY_RESOLVER`), built once per policy.
+        :param policy: str - a name in `GROUP_POLICIES` | dict - options
+        """
+        if isinstance(policy, str):
+            config = self.policies.get(policy)
+            if config is None:
+                raise ImproperlyConfigured(f"{policy!r} isn't in GROUP_POLICIES")
+            return config
+
+        key = _freeze(policy)
+        config = self.policies.get(key)
+        if config is None:
+            config = self.policies[key] = self._build_policy(policy)
+
+        return config
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+_cache: tuple = (None, None)
+
+
+def get_config() -> Optional[AutoLogoutConfig]:
+    """
+    Get the compiled `AUTO_LOGOUT` settings.
+    :return: AutoLogoutConfig | None - if auto logout isn't configured
+    """
+    global _cache
+    options = getattr(settings, 'AUTO_LOGOUT', None)
+    cached_options, config = _cache
+
+    # Settings may be replaced without `setting_changed` (e.g. in tests), so compare them too.
+    if options is not cached_options:
+        config = AutoLogoutConfig(options) if options else None
+        _cache = (options, config)
+
+    return config
+
+
+@receiver(user_logged_in)
+def _store_login_time(sender, request: Optional[HttpRequest], user, **kwargs) -> None:
+    options = getattr(settings, 'AUTO_LOGOUT', None)
+    if request is not None and options and options.get('STORE_LOGIN_TIME'):
+        get_config().activity_store.set_login_time(request, now())
+
+
+@receiver(setting_changed)
+def _reset_config(setting: str, **kwargs) -> None:
+    global _cache
+    if setting == 'AUTO_LOGOUT':
+        _cache = (None, None)
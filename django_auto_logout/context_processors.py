@@ -1,5 +1,17 @@
-from django.conf import settings
+from datetime import timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.templatetags.static import static
+from django.urls import NoReverseMatch, reverse
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
+from . import __version__
+from .conf import AutoLogoutConfig, get_config
+from .policies import resolve_config
 from .utils import now, seconds_until_session_end, seconds_until_idle_time_end
 
 LOGOUT_TIMEOUT_SCRIPT_PATTERN = """
@@ -33,37 +45,134 @@ def _trim(s: str) -> str:
     return ''.join([line.strip() for line in s.split('\n')])
 
 
-def auto_logout_client(request):
-    if request.user.is_anonymous:
-        return {}
+# The script is trimmed once, a render only inserts the time.
+_INLINE_SCRIPT_PREFIX, _INLINE_SCRIPT_SUFFIX = _trim(LOGOUT_TIMEOUT_SCRIPT_PATTERN).split('%s')
+
+
+@lru_cache(maxsize=16)
+def _get_static_script_parts(
+    coordination: str = 'tab',
+    check_url: Optional[str] = None,
+    redirect_url: Optional[str] = None,
+    jitter: int = 0,
+    heartbeat: int = 0,
+    heartbeat_url: Optional[str] = None,
+) -> Tuple[str, str]:
+    """
+    Get the tag of the static script (`CLIENT_SCRIPT = 'static'`) around the seconds until logout.
+    The version in the URL updates the script cached by browsers.
+    :param coordination: str - `CLIENT_COORDINATION`
+    :param check_url: str - `CLIENT_CHECK_URL` | None - the `remaining` view, if its URL is included
+    :param redirect_url: str - `CLIENT_REDIRECT_URL` | None - reload the page
+    :param jitter: int - `CLIENT_JITTER` in milliseconds
+    :param heartbeat: int - `CLIENT_HEARTBEAT` in milliseconds
+    :param heartbeat_url: str - `CLIENT_HEARTBEAT_URL` | None - the `heartbeat` view, if its URL is included
+    """
+    src = f"{static('django_auto_logout/auto_logout.js')}?v={__version__}"
+    attrs = ''
+    if coordination == 'leader':
+        attrs += ' data-leader'
+        if check_url is None:
+            try:
+                check_url = reverse('django_auto_logout:remaining')
+            except NoReverseMatch:
+                check_url = ''
+        if check_url:
+            attrs += f' data-check-url="{escape(check_url)}"'
+    if redirect_url:
+        attrs += f' data-redirect-url="{escape(redirect_url)}"'
+    if jitter:
+        attrs += f' data-jitter="{jitter}"'
+    if heartbeat:
+        if heartbeat_url is None:
+            try:
+                heartbeat_url = reverse('django_auto_logout:heartbeat')
+            except NoReverseMatch:
+                heartbeat_url = ''
+        if heartbeat_url:
+            attrs += f' data-heartbeat="{heartbeat}" data-heartbeat-url="{escape(heartbeat_url)}"'
+
+    return f'<script src="{escape(src)}" data-seconds="', f'"{attrs} defer></script>'
+
+
+@receiver(setting_changed)
+def _reset_static_script(setting: str, **kwargs) -> None:
+    if setting in ('STATIC_URL', 'STORAGES', 'STATICFILES_STORAGE', 'ROOT_URLCONF'):
+        _get_static_script_parts.cache_clear()
 
-    options = getattr(settings, 'AUTO_LOGOUT')
-    if not options:
-        return {}
 
-    ctx = {}
-    current_time = now()
+def _to_ms(interval: Optional[timedelta]) -> int:
+    return 0 if interval is None else int(interval.total_seconds() * 1000)
 
-    if 'SESSION_TIME' in options:
-        ctx['seconds_until_session_end'] = seconds_until_session_end(request, options['SESSION_TIME'], current_time)
 
-    if 'IDLE_TIME' in options:
-        ctx['seconds_until_idle_end'] = seconds_until_idle_time_end(request, options['IDLE_TIME'], current_time)
+def _get_client_context(request: HttpRequest, config: AutoLogoutConfig) -> dict:
+    """
+    Compute the context once per request, templates rendered after the first one reuse it.
+    """
+    ctx = getattr(request, '_django_auto_logout_client', None)
+    if ctx is not None:
+        return ctx
 
-    if options.get('REDIRECT_TO_LOGIN_IMMEDIATELY'):
-        at = None
+    ctx = request._django_auto_logout_client = {}
+    if request.user.is_anonymous:
+        return ctx
+
+    config = resolve_config(request, config)
+    # The time of the middleware for this request, so the idle time of an active user is whole.
+    current_time = getattr(request, '_django_auto_logout_now', None) or now()
+
+    if config.session_time is not None:
+        ctx['seconds_until_session_end'] = seconds_until_session_end(
+            request, config.session_time, current_time, config.activity_store,
+        )
+
+    if config.idle_time is not None:
+        ctx['seconds_until_idle_end'] = seconds_until_idle_time_end(
+            request, config.idle_time, current_time, config.activity_store,
+        )
 
-        if 'SESSION_TIME' in options and 'IDLE_TIME' in options:
-            at = (
-                f"at=Date.now()+Math.max(Math.min({ ctx['seconds_until_session_end'] },"
-                f"{ ctx['seconds_until_idle_end'] }),0)*1000+999;"
+    if config.redirect_to_login_immediately and ctx:
+        if config.client_script == 'static':
+            value = str(min(ctx.values()))
+            prefix, suffix = _get_static_script_parts(
+                config.client_coordination,
+                config.options.get('CLIENT_CHECK_URL'),
+                config.options.get('CLIENT_REDIRECT_URL'),
+                _to_ms(config.client_jitter),
+                _to_ms(config.client_heartbeat),
+                config.options.get('CLIENT_HEARTBEAT_URL'),
             )
-        elif 'SESSION_TIME' in options:
-            at = f"at=Date.now()+Math.max({ ctx['seconds_until_session_end'] },0)*1000+999;"
-        elif 'IDLE_TIME' in options:
-            at = f"at=Date.now()+Math.max({ ctx['seconds_until_idle_end'] },0)*1000+999;"
+            if config.client_heartbeat is not None:
+                # The token of the heartbeat POST differs per request, so it isn't in the cached parts.
+                value += f'" data-csrf-token="{escape(get_token(request))}'
+            ctx['redirect_to_login_immediately'] = mark_safe(f'{prefix}{value}{suffix}')
+        else:
+            # Clients logged in at once (e.g. at a shift start) reload at different times with `CLIENT_JITTER`.
+            jitter = _to_ms(config.client_jitter)
+            delay = f"+999+Math.random()*{jitter};" if jitter else "+999;"
+            if 'seconds_until_session_end' in ctx and 'seconds_until_idle_end' in ctx:
+                at = (
+                    f"at=Date.now()+Math.max(Math.min({ ctx['seconds_until_session_end'] },"
+                    f"{ ctx['seconds_until_idle_end'] }),0)*1000{delay}"
+                )
+            elif 'seconds_until_session_end' in ctx:
+                at = f"at=Date.now()+Math.max({ ctx['seconds_until_session_end'] },0)*1000{delay}"
+            else:
+                at = f"at=Date.now()+Math.max({ ctx['seconds_until_idle_end'] },0)*1000{delay}"
 
-        if at:
-            ctx['redirect_to_login_immediately'] = mark_safe(_trim(LOGOUT_TIMEOUT_SCRIPT_PATTERN % at))
+            ctx['redirect_to_login_immediately'] = mark_safe(_INLINE_SCRIPT_PREFIX + at + _INLINE_SCRIPT_SUFFIX)
 
     return ctx
+
+
+def auto_logout_client(request: HttpRequest) -> dict:
+    """
+    Values for templates: `seconds_until_session_end`, `seconds_until_idle_end`
+    and `redirect_to_login_immediately`. There are no values for anonymous users.
+    """
+    config = get_config()
+    if config is None:
+        return {}
+
+    # The numbers are plain floats, so they can be passed to `json_script` or `json.dumps`.
+    return dict(_get_client_context(request, config))
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+from weakref import WeakSet
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+
+class DeadlineCache:
+    """
+    Bounded LRU cache of the next time a request of the session can log out or store the activity
+    (seconds since epoch), see `AUTO_LOGOUT['DEADLINE_CACHE_SIZE']`.
+    Earlier requests skip the checks: they can't log out and `IDLE_TIME_RESOLUTION` skips their write anyway.
+    Activity in other processes only moves the deadlines forward, so a cached one is never too late.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _deadline_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def is_before(self, session_key: str, timestamp: float) -> bool:
+        """
+        :return: bool - the session has a deadline after the timestamp
+        """
+        with self._lock:
+            deadline = self._data.get(session_key)
+            if deadline is None:
+                return False
+            if deadline <= timestamp:
+                del self._data[session_key]
+                return False
+
+            self._data.move_to_end(session_key)
+            return True
+
+    def set(self, session_key: str, deadline: float) -> None:
+        with self._lock:
+            self._data[session_key] = deadline
+            self._data.move_to_end(session_key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, session_key: str) -> None:
+        with self._lock:
+            self._data.pop(session_key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_deadline_caches = WeakSet()
+
+
+def invalidate_deadlines(session_key: Optional[str] = None) -> None:
+    """
+    Drop the cached deadline of the session, or of all the sessions (e.g. on changes of policies).
+    """
+    for cache in list(_deadline_caches):
+        if session_key is None:
+            cache.clear()
+        else:
+            cache.invalidate(session_key)
+
+
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def _invalidate_on_login(sender, request: Optional[HttpRequest], **kwargs) -> None:
+    # The session starts again (e.g. with a new login time) or ends.
+    session_key = request.session.session_key if request is not None and hasattr(request, 'session') else None
+    if session_key:
+        invalidate_deadlines(session_key)
@@ -0,0 +1,72 @@
+from time import perf_counter
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from django_auto_logout.conf import AutoLogoutConfig, get_config
+from django_auto_logout.sessions import get_db_session_store, iter_deadlines, iter_session_chunks
+from django_auto_logout.utils import now
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sessions of users who would be logged out by auto logout on the next request. "
+        "Sessions are read in chunks, so memory usage doesn't depend on the number of sessions. "
+        "With BufferedCacheActivityStore sessions are deleted ACTIVITY_FLUSH_INTERVAL seconds after the logout time: "
+        "web processes may not have flushed the latest activity to the cache yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Sessions per query (default: 2000).")
+        parser.add_argument('--dry-run', action='store_true', help="Count the sessions, but don't delete them.")
+
+    def handle(self, chunk_size: int, dry_run: bool, **options):
+        config = get_config()
+        if config is None or (config.session_time is None and config.idle_time is None):
+            raise CommandError("AUTO_LOGOUT has neither SESSION_TIME nor IDLE_TIME.")
+        if not config.activity_store.is_server_side:
+            raise CommandError("ACTIVITY_STORE keeps the activity on the client, the sessions can't be checked.")
+
+        store_cls = get_db_session_store()
+        if store_cls is None:
+            raise CommandError(f"Session engine '{settings.SESSION_ENGINE}' doesn't store sessions in the database.")
+
+        started = perf_counter()
+        deleted = 0
+        for expired in self.iter_expired(store_cls, config, chunk_size):
+            if expired:
+                deleted += len(expired)
+                if not dry_run:
+                    self.delete(store_cls, expired)
+
+        duration = perf_counter() - started
+        self.stdout.write(
+            f"{'Found' if dry_run else 'Deleted'} {deleted} expired of {self.scanned} sessions "
+            f"in {duration:.2f}s ({self.scanned / max(duration, 1e-9):.0f} sessions/s)."
+        )
+
+    def iter_expired(self, store_cls, config: AutoLogoutConfig, chunk_size: int):
+        """
+        Yield lists of expired session keys, one per chunk.
+        """
+        current_time = now()
+        self.scanned = 0
+        # Buffered activity (see `BufferedCacheActivityStore`) may be in the memory of other processes.
+        grace = getattr(config.activity_store, 'flush_interval', 0)
+
+        for scanned, requests in iter_session_chunks(store_cls, chunk_size, config):
+            self.scanned += scanned
+            yield [
+                request.session.session_key
+                for batch, _, expired in iter_deadlines(requests, config, current_time, -grace)
+                for request, is_expired in zip(batch, expired) if is_expired
+            ]
+
+    def delete(self, store_cls, session_keys: list) -> None:
+        store_cls.get_model_class().objects.filter(session_key__in=session_keys).delete()
+
+        # `cached_db` sessions are in the cache too.
+        if hasattr(store_cls, 'cache_key_prefix'):
+            caches[settings.SESSION_CACHE_ALIAS].delete_many([
+                store_cls.cache_key_prefix + session_key for session_key in session_keys
+            ])
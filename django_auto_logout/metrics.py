@@ -0,0 +1,94 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Iterable
+
+# Counters
+CHECKS = 'checks'  # requests of logged in users checked by the middleware
+CHECKS_CACHED = 'checks.cached'  # checks skipped before the deadline, see `DEADLINE_CACHE_SIZE`
+LOGOUTS_IDLE = 'logouts.idle'
+LOGOUTS_SESSION = 'logouts.session'
+ACTIVITY_WRITES = 'activity.writes'  # the time of the last request is stored
+ACTIVITY_SKIPPED = 'activity.skipped'  # not stored: a passive request or `IDLE_TIME_RESOLUTION`
+
+# Histograms
+CHECK_SECONDS = 'check.seconds'  # time of the middleware without the view
+
+
+class MetricsExporter:
+    """
+    Receives the metrics of the middleware, see `AUTO_LOGOUT['METRICS_EXPORTERS']`.
+    Methods are called in the request, so they should be fast (e.g. send a UDP packet or update a counter).
+    """
+
+    def increment(self, name: str, value: int = 1) -> None:
+        pass
+
+    def observe(self, name: str, value: float) -> None:
+        pass
+
+
+class InMemoryMetrics(MetricsExporter):
+    """
+    In-process aggregator of the metrics: counters and histograms with cumulative buckets.
+    """
+    buckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, float('inf'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters = defaultdict(int)
+            self._histograms = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+
+            histogram['counts'][bisect_left(self.buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict - {'counters': {name: value}, 'histograms': {name: {'buckets': {le: count}, 'sum', 'count'}}}
+        """
+        with self._lock:
+            histograms = {}
+            for name, histogram in self._histograms.items():
+                total, buckets = 0, {}
+                for le, count in zip(self.buckets, histogram['counts']):
+                    total += count
+                    buckets[le] = total
+                histograms[name] = {'buckets': buckets, 'sum': histogram['sum'], 'count': histogram['count']}
+
+            return {'counters': dict(self._counters), 'histograms': histograms}
+
+
+class MultiExporter(MetricsExporter):
+    """
+    Sends the metrics to several exporters.
+    """
+
+    def __init__(self, exporters: Iterable[MetricsExporter]):
+        self.exporters = tuple(exporters)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        for exporter in self.exporters:
+            exporter.increment(name, value)
+
+    def observe(self, name: str, value: float) -> None:
+        for exporter in self.exporters:
+            exporter.observe(name, value)
+
+
+# The metrics of this process, if `AUTO_LOGOUT['METRICS']` is enabled.
+metrics = InMemoryMetrics()
@@ -1,13 +1,29 @@
 import logging
-from typing import Any, Callable, Optional
-from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured
+from time import perf_counter
+from typing import Callable, Optional, Tuple
+from asgiref.sync import async_to_sync, sync_to_async
 from django.http import HttpRequest, HttpResponse
 from django.contrib.auth import logout
 from django.contrib.messages import info
-from django.utils.module_loading import import_string
+from django.utils.decorators import sync_and_async_middleware
 
-from .utils import now, seconds_until_idle_time_end, seconds_until_session_end
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+try:
+    from django.contrib.auth import alogout
+except ImportError:  # Django < 5.1 uses the sync path, see `async_auto_logout`
+    alogout = None
+
+from . import push
+from .conf import AutoLogoutConfig, get_config
+from .metrics import (
+    ACTIVITY_SKIPPED, ACTIVITY_WRITES, CHECK_SECONDS, CHECKS, CHECKS_CACHED, LOGOUTS_IDLE, LOGOUTS_SESSION,
+)
+from .policies import aresolve_config, resolve_config
+from .utils import has_async_session, now, seconds_until_idle_time_end, seconds_until_session_end
 
 logger = logging.getLogger(__name__)
 
@@ -19,48 +35,298 @@ def _do_logout(request: HttpRequest, options) -> None:
         info(request, options['MESSAGE'])
 
 
-def _auto_logout(request: HttpRequest, options) -> Optional[HttpResponse]:
-    should_logout = False
-    current_time = now()
+async def _ado_logout(request: HttpRequest, options) -> None:
+    await alogout(request)
+
+    if 'MESSAGE' in options:
+        info(request, options['MESSAGE'])
+
+
+def _check_times(
+    request: HttpRequest, config: AutoLogoutConfig,
+) -> Tuple[Optional[str], Optional[float], Optional[float]]:
+    """
+    Check the session and idle time without storing anything.
+    :return: (logout reason | None, seconds until the session ends, seconds until idle ends)
+    """
+    reason = session_time = idle_time = None
+    current_time = request._django_auto_logout_now = now()
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    if config.session_time is not None:
+        session_time = seconds_until_session_end(
+            request, config.session_time, current_time, config.activity_store,
+        )
+        if session_time < 0:
+            reason = 'session'
+        if debug:
+            logger.debug('Check SESSION_TIME: %ss until session ends.', session_time)
+
+    if config.idle_time is not None:
+        idle_time = seconds_until_idle_time_end(request, config.idle_time, current_time, config.activity_store)
+        if idle_time < 0 and reason is None:
+            reason = 'idle'
+        if debug:
+            logger.debug('Check IDLE_TIME: %ss until idle ends.', idle_time)
+
+    return reason, session_time, idle_time
+
+
+def _should_store(request: HttpRequest, config: AutoLogoutConfig, reason: Optional[str]) -> bool:
+    return (
+        reason is None
+        and config.idle_time is not None
+        and not config.is_passive(request)
+        and config.activity_store.should_update(request, request._django_auto_logout_now)
+    )
+
+
+def _finish_check(
+    request: HttpRequest,
+    config: AutoLogoutConfig,
+    reason: Optional[str],
+    session_time: Optional[float],
+    idle_time: Optional[float],
+    stored: bool,
+) -> bool:
+    """
+    Count the check, publish the stored activity and remember the next check, see `DEADLINE_CACHE_SIZE`.
+    """
+    current_time = request._django_auto_logout_now
+    # Seconds until a request can log out or store the activity.
+    next_check = []
+
+    if session_time is not None:
+        next_check.append(session_time)
+
+    if idle_time is not None:
+        if stored:
+            idle_time = config.idle_time.total_seconds()
+            if config.metrics is not None:
+                config.metrics.increment(ACTIVITY_WRITES)
+
+            if config.push_events:
+                seconds = idle_time if session_time is None else min(idle_time, session_time)
+                push.publish_deadline(request, current_time.timestamp() + seconds)
+        elif reason is None and config.metrics is not None:
+            config.metrics.increment(ACTIVITY_SKIPPED)
+
+        # Without `IDLE_TIME_RESOLUTION` every request stores the activity.
+        resolution = config.idle_time_resolution
+        next_check.append(-1 if resolution is None else min(
+            idle_time, idle_time - config.idle_time.total_seconds() + resolution.total_seconds(),
+        ))
+
+    if config.metrics is not None:
+        config.metrics.increment(CHECKS)
+        if reason is not None:
+            config.metrics.increment(LOGOUTS_SESSION if reason == 'session' else LOGOUTS_IDLE)
+
+    if config.deadline_cache is not None and reason is None and next_check and min(next_check) > 0:
+        request._django_auto_logout_next_check = current_time.timestamp() + min(next_check)
+
+    return reason is not None
+
+
+def _should_logout(request: HttpRequest, config: AutoLogoutConfig) -> bool:
+    """
+    Check the session and idle time, refresh the time of the last request (if it isn't passive).
+    """
+    reason, session_time, idle_time = _check_times(request, config)
+    store = config.activity_store
+    stored = False
+
+    if reason is not None and idle_time is not None:
+        store.delete_last_request(request)
+    elif _should_store(request, config, reason):
+        stored = store.claim_write(request, request._django_auto_logout_now)
+        if stored:
+            store.set_last_request(request, request._django_auto_logout_now)
+
+    return _finish_check(request, config, reason, session_time, idle_time, stored)
+
+
+async def _ashould_logout(request: HttpRequest, config: AutoLogoutConfig) -> bool:
+    """
+    `_should_logout` that stores the activity without blocking the event loop.
+    The activity should be loaded already, see `ActivityStore.aload`.
+    """
+    reason, session_time, idle_time = _check_times(request, config)
+    store = config.activity_store
+    stored = False
+
+    if reason is not None and idle_time is not None:
+        await store.adelete_last_request(request)
+    elif _should_store(request, config, reason):
+        stored = await store.aclaim_write(request, request._django_auto_logout_now)
+        if stored:
+            await store.aset_last_request(request, request._django_auto_logout_now)
+
+    return _finish_check(request, config, reason, session_time, idle_time, stored)
+
+
+def _auto_logout(request: HttpRequest, config: AutoLogoutConfig) -> Optional[HttpResponse]:
+    if _should_logout(request, config):
+        request._django_auto_logout_logged_out = True
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Logout user %s', request.user)
+        logout_func = config.logout_func or _do_logout
+        if iscoroutinefunction(logout_func):
+            # An async `CUSTOM_LOGOUT_FUNC` in the thread of `async_auto_logout` on Django < 5.1.
+            logout_func = async_to_sync(logout_func)
+        return logout_func(request, config.options)
+
 
-    if 'SESSION_TIME' in options:
-        session_time = seconds_until_session_end(request, options['SESSION_TIME'], current_time)
-        should_logout |= session_time < 0
-        logger.debug('Check SESSION_TIME: %ss until session ends.', session_time)
+async def _aauto_logout(request: HttpRequest, config: AutoLogoutConfig) -> Optional[HttpResponse]:
+    config = await aresolve_config(request, config)
 
-    if 'IDLE_TIME' in options:
-        idle_time = seconds_until_idle_time_end(request, options['IDLE_TIME'], current_time)
-        should_logout |= idle_time < 0
-        logger.debug('Check IDLE_TIME: %ss until idle ends.', idle_time)
+    # Load the activity without blocking the event loop:
+    # `_ashould_logout` works with the cached data after this.
+    await config.activity_store.aload(request)
 
-        if should_logout and 'django_auto_logout_last_request' in request.session:
-            del request.session['django_auto_logout_last_request']
+    if await _ashould_logout(request, config):
+        request._django_auto_logout_logged_out = True
+        # The user may be not loaded yet, see `STORE_LOGIN_TIME`.
+        request.user = await request.auser()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Logout user %s', request.user)
+        logout_func = config.logout_func
+
+        if logout_func is None:
+            return await _ado_logout(request, config.options)
+        elif iscoroutinefunction(logout_func):
+            return await logout_func(request, config.options)
         else:
-            request.session['django_auto_logout_last_request'] = current_time.isoformat()
+            return await sync_to_async(logout_func)(request, config.options)
 
-    if should_logout:
-        logger.debug('Logout user %s', request.user)
-        logout_func = options.get('CUSTOM_LOGOUT_FUNC', _do_logout)
-        return logout_func(request, options)
 
+def _is_skipped(request: HttpRequest, config: Optional[AutoLogoutConfig]) -> bool:
+    return config is None or (config.is_excluded is not None and config.is_excluded(request))
 
-def auto_logout(get_response: Callable[[HttpRequest], HttpResponse]) -> Callable:
-    options: Optional[dict[str, Any]] = getattr(settings, 'AUTO_LOGOUT', None)
-    if not options:
+
+def _is_cached(request: HttpRequest, config: AutoLogoutConfig) -> bool:
+    """
+    Check if the session is before its cached deadline (see `DEADLINE_CACHE_SIZE`),
+    without loading the session and the user.
+    """
+    session_key = request.session.session_key
+    if session_key is None:
+        return False
+
+    current_time = now()
+    if not config.deadline_cache.is_before(session_key, current_time.timestamp()):
+        return False
+
+    request._django_auto_logout_now = current_time
+    if config.metrics is not None:
+        config.metrics.increment(CHECKS)
+        config.metrics.increment(CHECKS_CACHED)
+    return True
+
+
+def _cache_deadline(request: HttpRequest, config: AutoLogoutConfig) -> None:
+    # Set by `_finish_check`, if the user stays logged in.
+    next_check = getattr(request, '_django_auto_logout_next_check', None)
+    session_key = request.session.session_key
+    if next_check is None or session_key is None:
+        return
+
+    # New policies of the user apply after `POLICY_CACHE_TTL` at the latest.
+    if config.policy_cache is not None:
+        next_check = min(next_check, request._django_auto_logout_now.timestamp() + config.policy_cache.ttl)
+    config.deadline_cache.set(session_key, next_check)
+
+
+def _check(request: HttpRequest, config: AutoLogoutConfig) -> Optional[HttpResponse]:
+    if config.deadline_cache is not None and _is_cached(request, config):
+        return None
+
+    # The login time is stored only for logged in users, so the user isn't loaded.
+    if config.activity_store.get_login_time(request) is not None or not request.user.is_anonymous:
+        response = _auto_logout(request, resolve_config(request, config))
+        if config.deadline_cache is not None:
+            _cache_deadline(request, config)
+        return response
+
+
+def _process_response(request: HttpRequest, response: HttpResponse, config: AutoLogoutConfig) -> None:
+    config.activity_store.process_response(request, response)
+
+    # Clients (e.g. the leader tab) spread their reloads after the logout over `LOGOUT_RETRY_AFTER` seconds.
+    if (
+        config.logout_retry_after is not None
+        and getattr(request, '_django_auto_logout_logged_out', False)
+        and not response.has_header('Retry-After')
+    ):
+        response['Retry-After'] = str(config.logout_retry_after)
+
+
+def _check_settings() -> None:
+    # Invalid settings raise errors on start, not in the middle of a request.
+    if get_config() is None:
         logger.warning('Auto logout settings are not specified')
-    elif 'CUSTOM_LOGOUT_FUNC' in options:
-        custom_logout_func_value = options['CUSTOM_LOGOUT_FUNC']
-        if isinstance(custom_logout_func_value, str):
-            options['CUSTOM_LOGOUT_FUNC'] = import_string(custom_logout_func_value)
 
-        if not callable(options['CUSTOM_LOGOUT_FUNC']):
-            raise ImproperlyConfigured("CUSTOM_LOGOUT_FUNC should be a function")
+
+def auto_logout(get_response: Callable[[HttpRequest], HttpResponse]) -> Callable:
+    _check_settings()
 
     def middleware(request: HttpRequest) -> HttpResponse:
-        response = None
-        if not request.user.is_anonymous and options is not None:
-            response = _auto_logout(request, options)
+        config = get_config()
+        if _is_skipped(request, config):
+            return get_response(request)
+
+        if config.metrics is None:
+            response = _check(request, config) or get_response(request)
+        else:
+            started = perf_counter()
+            response = _check(request, config)
+            config.metrics.observe(CHECK_SECONDS, perf_counter() - started)
+            response = response or get_response(request)
+
+        _process_response(request, response, config)
+        return response
+
+    return middleware
+
+
+@sync_and_async_middleware
+def async_auto_logout(get_response: Callable) -> Callable:
+    """
+    Sync and async capable `auto_logout`.
+    Under ASGI it loads the user, the session and logs out without leaving the event loop.
+    """
+    if not iscoroutinefunction(get_response):
+        return auto_logout(get_response)
+
+    _check_settings()
+
+    async def middleware(request: HttpRequest) -> HttpResponse:
+        config = get_config()
+        if _is_skipped(request, config):
+            return await get_response(request)
+
+        started = perf_counter()
+        if config.deadline_cache is not None and _is_cached(request, config):
+            response = None
+        elif not has_async_session(request):
+            # Django < 5.1 can't load the session asynchronously.
+            response = await sync_to_async(_check)(request, config)
+        elif await config.activity_store.aget_login_time(request) is not None:
+            response = await _aauto_logout(request, config)
+        else:
+            # The loaded user replaces the lazy one,
+            # so `request.user` doesn't hit the database in async context.
+            request.user = await request.auser()
+            response = None if request.user.is_anonymous else await _aauto_logout(request, config)
+
+        if config.deadline_cache is not None:
+            _cache_deadline(request, config)
+
+        if config.metrics is not None:
+            config.metrics.observe(CHECK_SECONDS, perf_counter() - started)
 
-        return response or get_response(request)
+        response = response or await get_response(request)
+        _process_response(request, response, config)
+        return response
 
     return middleware
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Hashable, Optional
+from weakref import WeakSet
+from asgiref.sync import sync_to_async
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+from .deadlines import invalidate_deadlines
+
+_MISSING = object()
+
+
+class PolicyCache:
+    """
+    Bounded LRU cache of resolved policies with a TTL, so `POLICY_RESOLVER`
+    (and its queries) runs once per user in `POLICY_CACHE_TTL` seconds.
+    The policies are dropped on changes of groups and permissions.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _policy_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable):
+        """
+        :return: the policy | _MISSING - if it isn't cached or expired
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+
+            expires_at, policy = item
+            if expires_at <= monotonic():
+                del self._data[key]
+                return _MISSING
+
+            self._data.move_to_end(key)
+            return policy
+
+    def set(self, key: Hashable, policy: Optional[dict]) -> None:
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, policy)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_policy_caches = WeakSet()
+
+
+def group_policy(request: HttpRequest, options: dict) -> Optional[str]:
+    """
+    `POLICY_RESOLVER` with the policies in `AUTO_LOGOUT['GROUP_POLICIES']`:
+    `{name: {'IDLE_TIME': ..., 'SESSION_TIME': ...}}`, where the name is a group name,
+    `is_staff` or `is_superuser`.
+    :return: str - the name of the first matching policy | None
+    """
+    user = request.user
+    policies = options.get('GROUP_POLICIES') or {}
+    groups = None
+
+    for name in policies:
+        if name in ('is_staff', 'is_superuser'):
+            if getattr(user, name, False):
+                return name
+            continue
+
+        if groups is None:
+            if 'groups' in getattr(user, '_prefetched_objects_cache', ()):
+                # Prefetched by `iter_session_chunks`.
+                groups = {group.name for group in user.groups.all()}
+            else:
+                groups = set(user.groups.values_list('name', flat=True))
+        if name in groups:
+            return name
+
+    return None
+
+
+def _get_policy(request: HttpRequest, config):
+    key = request.session.get(SESSION_KEY)
+    if key is None:
+        return None, _MISSING
+    return key, config.policy_cache.get(key)
+
+
+def resolve_config(request: HttpRequest, config):
+    """
+    Get the config with the policy of the user (see `POLICY_RESOLVER`).
+    :param config: django_auto_logout.conf.AutoLogoutConfig
+    :return: AutoLogoutConfig - the same one if there is no policy
+    """
+    if config.policy_resolver is None:
+        return config
+
+    key, policy = _get_policy(request, config)
+    if key is None:
+        return config
+
+    if policy is _MISSING:
+        policy = config.policy_resolver(request, config.options)
+        config.policy_cache.set(key, policy)
+
+    return config.with_policy(policy) if policy else config
+
+
+async def aresolve_config(request: HttpRequest, config):
+    """
+    Async `resolve_config`: the resolver runs in a thread, if the policy isn't cached.
+    The session should be loaded already.
+    """
+    if config.policy_resolver is None:
+        return config
+
+    key, policy = _get_policy(request, config)
+    if key is None:
+        return config
+
+    if policy is _MISSING:
+        policy = await sync_to_async(config.policy_resolver)(request, config.options)
+        config.policy_cache.set(key, policy)
+
+    return config.with_policy(policy) if policy else config
+
+
+def _invalidate(user_pk=None) -> None:
+    policy_caches = list(_policy_caches)
+    for cache in policy_caches:
+        if user_pk is None:
+            cache.clear()
+        else:
+            cache.invalidate(str(user_pk))
+
+    # The sessions of a user aren't known: all the deadlines are dropped, so the new policy applies at once.
+    if policy_caches:
+        invalidate_deadlines()
+
+
+@receiver(m2m_changed)
+def _invalidate_on_m2m_change(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    from django.contrib.auth.models import Group
+
+    user_model = get_user_model()
+    user_senders = [getattr(user_model, name).through for name in ('groups', 'user_permissions')
+                    if hasattr(user_model, name)]
+    if sender in user_senders:
+        if isinstance(instance, user_model):
+            _invalidate(instance.pk)
+        elif pk_set:
+            for pk in pk_set:
+                _invalidate(pk)
+        else:
+            _invalidate()
+    elif sender is Group.permissions.through:
+        _invalidate()
+
+
+@receiver(post_save)
+def _invalidate_on_user_change(sender, instance, update_fields=None, **kwargs) -> None:
+    # `is_staff`, `is_superuser` may change. Login updates only `last_login`.
+    if sender is get_user_model() and update_fields != frozenset(['last_login']):
+        _invalidate(instance.pk)
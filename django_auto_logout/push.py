@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from django.contrib.auth.signals import user_logged_out
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+
+class Event(NamedTuple):
+    id: int
+    name: str  # 'deadline' | 'logout'
+    data: dict
+
+
+class _Channel:
+    __slots__ = ('event', 'waiters')
+
+    def __init__(self):
+        self.event: Optional[Event] = None
+        self.waiters: list = []  # (loop, future)
+
+
+def _set_result(future: asyncio.Future, event: Event) -> None:
+    if not future.done():
+        future.set_result(event)
+
+
+class Registry:
+    """
+    In-process registry of auto logout events for the push views.
+
+    Every session with an open `events` or `poll` request has a channel
+    with the latest event. Events are published from any thread
+    (e.g. the sync middleware) and wake up the waiters in their event loops.
+    Sessions without listeners are ignored, so publishing costs a dict lookup.
+    """
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._channels = OrderedDict()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def __contains__(self, session_key: str) -> bool:
+        return session_key in self._channels
+
+    def open(self, session_key: str) -> int:
+        """
+        Start listening to the session, so its events are kept between the waits.
+        Call it before reading the current state, not to miss an event in between.
+        :return: int - the id to wait for the events after
+        """
+        with self._lock:
+            if session_key in self._channels:
+                self._channels.move_to_end(session_key)
+            else:
+                self._channels[session_key] = _Channel()
+                # The oldest sessions are forgotten, their waiters get a timeout.
+                while len(self._channels) > self.max_sessions:
+                    self._channels.popitem(last=False)
+
+            return self._last_id
+
+    def close(self, session_key: str) -> None:
+        """
+        Stop listening to the session, e.g. it isn't logged in.
+        """
+        with self._lock:
+            self._channels.pop(session_key, None)
+
+    def publish(self, session_key: str, name: str, data: Optional[dict] = None) -> None:
+        with self._lock:
+            channel = self._channels.get(session_key)
+            if channel is None:
+                return
+
+            self._last_id = next(self._ids)
+            channel.event = event = Event(self._last_id, name, data or {})
+            waiters, channel.waiters = channel.waiters, []
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_result, future, event)
+            except RuntimeError:  # the loop is closed
+                pass
+
+    async def wait(self, session_key: str, after: int, timeout: float) -> Optional[Event]:
+        """
+        Wait for an event of the session newer than `after`.
+        Only sessions of `open` have channels, so clients can't add them without a limit.
+        :return: Event | None - on timeout or at once, if the session isn't open (or is forgotten)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        with self._lock:
+            channel = self._channels.get(session_key)
+            if channel is None:
+                return None
+            if channel.event is not None and channel.event.id > after:
+                return channel.event
+
+            waiter = (loop, future)
+            channel.waiters.append(waiter)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                if waiter in channel.waiters:
+                    channel.waiters.remove(waiter)
+
+
+registry = Registry()
+
+
+def publish_deadline(request: HttpRequest, deadline: float) -> None:
+    """
+    Notify the listeners of the session about the new logout time.
+    :param deadline: float - seconds since epoch
+    """
+    session_key = request.session.session_key
+    if session_key:
+        registry.publish(session_key, 'deadline', {'deadline': deadline})
+
+
+@receiver(user_logged_out)
+def _publish_logout(sender, request: Optional[HttpRequest], **kwargs) -> None:
+    # Every logout: automatic, by the user or in another tab.
+    session_key = None if request is None else request.session.session_key
+    if session_key:
+        registry.publish(session_key, 'logout')
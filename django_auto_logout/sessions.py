@@ -0,0 +1,112 @@
+from datetime import datetime
+from importlib import import_module
+from typing import Iterator, List, Optional, Sequence, Tuple, Type
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.base import SessionBase
+from django.http import HttpRequest
+from django.utils import timezone
+
+from .conf import AutoLogoutConfig
+from .policies import resolve_config
+from .utils import bulk_logout_deadlines
+
+
+def get_db_session_store() -> Optional[Type[SessionBase]]:
+    """
+    :return: SessionStore - of `SESSION_ENGINE` | None - if it doesn't store sessions in the database
+    """
+    store_cls = import_module(settings.SESSION_ENGINE).SessionStore
+    return store_cls if hasattr(store_cls, 'get_model_class') else None
+
+
+def iter_session_chunks(
+    store_cls: Type[SessionBase],
+    chunk_size: int,
+    config: Optional[AutoLogoutConfig] = None,
+) -> Iterator[Tuple[int, List[HttpRequest]]]:
+    """
+    Read the unexpired sessions from the database in chunks.
+    Chunks are selected by the last seen key, not with an open cursor,
+    so the sessions can be deleted between them on any database.
+    :param config: AutoLogoutConfig - with `POLICY_RESOLVER` the users are loaded with their fields and groups
+    :return: iterator - the number of sessions in the chunk and requests with the session and the user
+        for the logged in ones (without deleted users)
+    """
+    model = store_cls.get_model_class()
+    user_model = get_user_model()
+    users_qs = user_model._default_manager.all()
+    if config is None or config.policy_resolver is None:
+        users_qs = users_qs.only('pk', 'last_login')
+    elif hasattr(user_model, 'groups'):
+        # The resolver reads `is_staff`, `is_superuser` and the groups (see `group_policy`) of every user.
+        users_qs = users_qs.prefetch_related('groups')
+    last_key = ''
+
+    while True:
+        rows = list(
+            model.objects
+            .filter(session_key__gt=last_key, expire_date__gt=timezone.now())
+            .order_by('session_key')
+            .values_list('session_key', 'session_data')[:chunk_size]
+        )
+        if not rows:
+            return
+
+        last_key = rows[-1][0]
+
+        sessions = []
+        for session_key, session_data in rows:
+            session = store_cls(session_key)
+            session._session_cache = session.decode(session_data)
+            if SESSION_KEY in session._session_cache:
+                sessions.append(session)
+
+        user_ids = {session[SESSION_KEY] for session in sessions}
+        users = {
+            user_model._meta.pk.value_to_string(user): user
+            for user in users_qs.filter(pk__in=user_ids)
+        }
+
+        requests = []
+        for session in sessions:
+            user = users.get(session[SESSION_KEY])
+            if user is not None:
+                request = HttpRequest()
+                request.session = session
+                request.user = user
+                requests.append(request)
+
+        yield len(rows), requests
+
+
+def iter_deadlines(
+    requests: Sequence[HttpRequest],
+    config: AutoLogoutConfig,
+    current_time: datetime,
+    within: float = 0,
+) -> Iterator[Tuple[List[HttpRequest], Sequence[float], Sequence[bool]]]:
+    """
+    Get the logout times of the sessions with `bulk_logout_deadlines`, one batch per policy (see `POLICY_RESOLVER`).
+    :return: iterator - requests, their deadlines and if they end within `within` seconds
+    """
+    batches = {}
+    for request in requests:
+        batches.setdefault(resolve_config(request, config), []).append(request)
+
+    for batch_config, batch in batches.items():
+        store = batch_config.activity_store
+        if batch_config.idle_time is None:
+            last_requests = [None] * len(batch)
+        else:
+            last_requests = [store.get_last_request(request) for request in batch]
+
+        deadlines, expiring = bulk_logout_deadlines(
+            [store.get_login_timestamp(request) for request in batch],
+            last_requests,
+            current_time,
+            batch_config.session_time,
+            batch_config.idle_time,
+            within,
+        )
+        yield batch, deadlines, expiring
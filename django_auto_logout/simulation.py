@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence
+from uuid import uuid4
+from django.contrib.auth import SESSION_KEY
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from .clock import VirtualClock, override_clock
+from .conf import AutoLogoutConfig, get_config
+from .middleware import _should_logout
+from .stores import CacheActivityStore
+
+
+class _Session(dict):
+    __slots__ = ('session_key',)
+
+    def __init__(self, session_key: str):
+        super().__init__()
+        self.session_key = session_key
+
+
+class _User:
+    __slots__ = ('pk', 'last_login')
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, pk: int, last_login: datetime):
+        self.pk = pk
+        self.last_login = last_login
+
+
+class _Request:
+    """
+    Enough of `HttpRequest` for the checks of the middleware.
+    """
+    __slots__ = (
+        'user', 'session', '_django_auto_logout_now', '_django_auto_logout_last_request',
+        # `SignedCookieActivityStore`: the times of the cookie stay in the request between the requests of a user.
+        '_django_auto_logout_cookie', '_django_auto_logout_cookie_changed',
+    )
+    method = 'GET'
+    path_info = '/'
+    META = {}
+    COOKIES = {}
+
+    def __init__(self, user: _User, session: _Session):
+        self.user = user
+        self.session = session
+
+
+def replay(
+    timelines: Iterable[Sequence[float]],
+    options: Optional[dict] = None,
+    start: Optional[datetime] = None,
+) -> List[Optional[float]]:
+    """
+    Replay request timelines of logged in users against the checks of the middleware in virtual time,
+    e.g. to check the expiry settings on millions of synthetic users without waiting.
+    Metrics, push events, `ACTIVITY_WRITE_GUARD` and `DEADLINE_CACHE_SIZE` are disabled,
+    the activity store and `IDLE_TIME_RESOLUTION` work as usual.
+    Cache stores use a private cache of the replay, not `ACTIVITY_CACHE`.
+    :param timelines: iterable - seconds since the login of every request of the user, in ascending order
+    :param options: dict - `AUTO_LOGOUT` settings, the current ones by default
+    :param start: datetime - the login time of the users, now by default
+    :return: list - seconds since the login of the request which logged out the user | None, for every timeline
+    """
+    if options is None:
+        config = get_config()
+        options = None if config is None else config.options
+    if not options:
+        raise ImproperlyConfigured('Auto logout settings are not specified')
+
+    # Replays don't depend on each other and don't touch the keys of real sessions:
+    # the store of the replay gets a private cache, the store of the settings isn't changed.
+    private_cache = LocMemCache('django_auto_logout.simulation', {'KEY_PREFIX': uuid4().hex})
+    config = AutoLogoutConfig({
+        **options, 'METRICS': False, 'METRICS_EXPORTERS': (), 'PUSH_EVENTS': False, 'ACTIVITY_WRITE_GUARD': False,
+        'DEADLINE_CACHE_SIZE': None, 'ACTIVITY_CACHE': private_cache,
+    })
+    store = config.activity_store
+
+    clock = VirtualClock(start)
+    login_time = clock.now()
+    results = []
+
+    with override_clock(clock):
+        for index, timeline in enumerate(timelines):
+            session = _Session(f'simulation:{index}')
+            session[SESSION_KEY] = str(index)
+            request = _Request(_User(index, login_time), session)
+            clock.set(login_time)
+            if config.store_login_time:
+                config.activity_store.set_login_time(request, login_time)
+
+            logged_out_at = None
+            for offset in timeline:
+                clock.set(login_time + timedelta(seconds=offset))
+                if _should_logout(request, config):
+                    logged_out_at = offset
+                    break
+
+            results.append(logged_out_at)
+            if isinstance(store, CacheActivityStore):
+                store.delete_last_request(request)
+
+    return results
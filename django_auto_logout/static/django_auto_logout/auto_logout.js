@@ -0,0 +1,219 @@
+/*
+ * django-auto-logout: reload the page when the session or idle time runs out.
+ * <script src="auto_logout.js" data-seconds="{seconds until logout}"></script>
+ *
+ * Options (see `CLIENT_COORDINATION`):
+ * - data-leader: one tab of the browser runs the timer and tells the other tabs to leave,
+ * - data-check-url: the leader asks the remaining time there before leaving (`remaining` view),
+ * - data-redirect-url: where to go instead of reloading the page,
+ * - data-jitter: up to so many milliseconds later, so clients don't reload at once (`CLIENT_JITTER`),
+ * - data-heartbeat, data-heartbeat-url, data-csrf-token: POST to the `heartbeat` view on mouse, keyboard
+ *   and touch events at most once in so many milliseconds, so reading a page is activity (`CLIENT_HEARTBEAT`).
+ */
+(function () {
+    var w = window,
+        s = w.localStorage,
+        script = document.currentScript,
+        seconds = parseFloat(script.getAttribute('data-seconds')),
+        redirectUrl = script.getAttribute('data-redirect-url'),
+        jitter = parseFloat(script.getAttribute('data-jitter')) || 0,
+        at = Date.now() + Math.max(seconds, 0) * 1000 + 999 + Math.random() * jitter;
+
+    function leave() {
+        if (redirectUrl) {
+            w.location.assign(redirectUrl);
+        }
+        else {
+            w.location.replace(w.location.href);
+        }
+    }
+
+    // The deadline of the server moves the time of all tabs forward, see `everyTab` and `leaderTab`.
+    function heartbeat() {
+        var interval = parseFloat(script.getAttribute('data-heartbeat')),
+            url = script.getAttribute('data-heartbeat-url'),
+            token = script.getAttribute('data-csrf-token'),
+            last = Date.now();  // loading the page was a request
+
+        function beat() {
+            if (Date.now() - last < interval) {
+                return;
+            }
+            last = Date.now();
+            w.fetch(url, {method: 'POST', credentials: 'same-origin', headers: {'X-CSRFToken': token}})
+                .then(function (response) {
+                    var deadline = parseFloat(response.headers.get('X-Auto-Logout-Deadline'));
+                    if (response.status === 204 && deadline) {
+                        s['djalLogoutAt'] = Math.max(
+                            parseFloat(s['djalLogoutAt']) || 0, deadline * 1000 + 999 + Math.random() * jitter
+                        );
+                    }
+                }, function () {});  // the timer logs out anyway
+        }
+
+        if (interval && url && w.fetch) {
+            ['mousemove', 'mousedown', 'keydown', 'scroll', 'touchstart'].forEach(function (type) {
+                w.addEventListener(type, beat, {passive: true});
+            });
+        }
+    }
+
+    function everyTab() {
+        // Other tabs of the session move the time forward.
+        s['djalLogoutAt'] = at;
+
+        function upd() {
+            if (s['djalLogoutAt'] > at) {
+                at = s['djalLogoutAt'];
+                setTimeout(upd, at - Date.now());
+            }
+            else {
+                delete s['djalLogoutAt'];
+                leave();
+            }
+        }
+
+        setTimeout(upd, at - Date.now());
+    }
+
+    function leaderTab() {
+        var id = Math.random().toString(36).slice(2),
+            checkUrl = script.getAttribute('data-check-url'),
+            lease = 10000,  // ms, another tab takes the lead if the leader doesn't renew it
+            maxDelay = 60000,  // ms after the time runs out: leave even if the server doesn't answer
+            failures = 0,
+            retryAt = 0,
+            pending = false,  // a check request is in flight
+            channel = w.BroadcastChannel ? new w.BroadcastChannel('django-auto-logout') : null,
+            timer = null,
+            done = false;
+
+        // Messages to other tabs: BroadcastChannel or `storage` events.
+        function send(message) {
+            if (channel) {
+                channel.postMessage(message);
+            }
+            else {
+                s['djalMessage'] = JSON.stringify({id: id, nonce: Math.random(), message: message});
+            }
+        }
+
+        function receive(message) {
+            if (message.type === 'logout' && !done) {
+                done = true;
+                leave();
+            }
+            else if (message.type === 'resign') {
+                elect();
+            }
+        }
+
+        if (channel) {
+            channel.onmessage = function (event) { receive(event.data); };
+        }
+        else {
+            w.addEventListener('storage', function (event) {
+                if (event.key === 'djalMessage' && event.newValue) {
+                    receive(JSON.parse(event.newValue).message);
+                }
+            });
+        }
+
+        function isLeader() {
+            return (s['djalLeader'] || '').split(':')[0] === id;
+        }
+
+        // The lease is `{tab id}:{expires at}` in localStorage, every tab renews or takes it.
+        function elect() {
+            var current = (s['djalLeader'] || '').split(':');
+            if (current[0] === id || !(parseFloat(current[1]) > Date.now())) {
+                s['djalLeader'] = id + ':' + (Date.now() + lease);
+            }
+            schedule();
+        }
+
+        function schedule() {
+            clearTimeout(timer);
+            if (isLeader() && !done && !pending) {
+                timer = setTimeout(check, Math.max(at - Date.now(), retryAt - Date.now(), 0));
+            }
+        }
+
+        function logout() {
+            done = true;
+            delete s['djalLogoutAt'];
+            send({type: 'logout'});
+            leave();
+        }
+
+        function check() {
+            // The latest page of the session has the latest time.
+            at = Math.max(at, parseFloat(s['djalLogoutAt']) || 0);
+            if (!isLeader() || done || pending) {
+                return;
+            }
+            if (at > Date.now() || retryAt > Date.now()) {
+                return schedule();
+            }
+            if (!checkUrl || !w.fetch) {
+                return logout();
+            }
+
+            // One passive request: the session may be extended on another device.
+            var spread = 0;
+            pending = true;
+            w.fetch(checkUrl, {credentials: 'same-origin', headers: {'X-Auto-Logout-Passive': '1'}})
+                .then(function (response) {
+                    if (!response.ok) {
+                        throw response;
+                    }
+                    // `LOGOUT_RETRY_AFTER`: the server spreads the reloads after the logout.
+                    spread = parseFloat(response.headers.get('Retry-After')) || 0;
+                    return response.json();
+                })
+                .then(function (data) {
+                    pending = false;
+                    var end = Math.min(data.session_end_at || Infinity, data.idle_end_at || Infinity) * 1000;
+                    failures = 0;
+                    if (data.logged_in && end > Date.now()) {
+                        at = end + 999 + Math.random() * jitter;
+                        s['djalLogoutAt'] = at;
+                        schedule();
+                    }
+                    else {
+                        done = true;
+                        setTimeout(logout, Math.random() * spread * 1000);
+                    }
+                })
+                .catch(retry);
+        }
+
+        // Exponential backoff with jitter (or `Retry-After` of the server), at most `maxDelay` after the time.
+        function retry(error) {
+            pending = false;
+            var retryAfter = error && error.headers ? parseFloat(error.headers.get('Retry-After')) : NaN,
+                delay = retryAfter >= 0 ? retryAfter * 1000 : Math.min(1000 * Math.pow(2, failures), 30000);
+            failures += 1;
+            delay = Math.min(delay * (0.5 + Math.random() / 2), at + maxDelay - Date.now());
+            if (delay <= 0) {
+                return logout();
+            }
+            retryAt = Date.now() + delay;
+            schedule();
+        }
+
+        w.addEventListener('pagehide', function () {
+            if (isLeader()) {
+                delete s['djalLeader'];
+                send({type: 'resign'});
+            }
+        });
+
+        s['djalLogoutAt'] = Math.max(at, parseFloat(s['djalLogoutAt']) || 0);
+        elect();
+        setInterval(elect, lease / 3);
+    }
+
+    w.addEventListener('load', script.hasAttribute('data-leader') ? leaderTab : everyTab);
+    w.addEventListener('load', heartbeat);
+})();
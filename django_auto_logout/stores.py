@@ -0,0 +1,468 @@
+import atexit
+import threading
+from datetime import datetime
+from typing import Optional, Tuple
+from weakref import WeakSet
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core import signing
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest, HttpResponse
+
+try:
+    from django.core.signing import b62_decode, b62_encode
+except ImportError:  # Django < 4.0
+    from django.utils.baseconv import base62
+    b62_decode, b62_encode = base62.decode, base62.encode
+
+from .utils import decode_timestamp, encode_timestamp, last_request_timestamp, should_update_last_request
+
+_NOT_LOADED = object()
+
+
+class ActivityStore:
+    """
+    Keeps the time of the last request for `IDLE_TIME`.
+    Set `AUTO_LOGOUT['ACTIVITY_STORE']` to use another one.
+    """
+
+    login_time_key = 'django_auto_logout_login_time'
+    guard_key_prefix = 'django_auto_logout:write_guard'
+    # The times can be read without the request (e.g. by `autologout_sweep`).
+    is_server_side = True
+
+    def __init__(self, config):
+        self.config = config
+
+    def get_cache(self) -> BaseCache:
+        """
+        Get the cache of `ACTIVITY_CACHE`: an alias from `CACHES` or a cache instance.
+        """
+        cache = self.config.options.get('ACTIVITY_CACHE', DEFAULT_CACHE_ALIAS)
+        return caches[cache] if isinstance(cache, str) else cache
+
+    async def aload(self, request: HttpRequest) -> None:
+        """
+        Load the time of the last request, so the other methods don't block the event loop.
+        """
+
+    def get_login_time(self, request: HttpRequest) -> Optional[float]:
+        """
+        Get the login time of this session, see `STORE_LOGIN_TIME`.
+        :return: float - seconds since epoch | None - if it isn't stored
+        """
+        if not self.config.store_login_time:
+            return None
+
+        value = request.session.get(self.login_time_key)
+        return None if value is None else decode_timestamp(value)
+
+    async def aget_login_time(self, request: HttpRequest) -> Optional[float]:
+        if not self.config.store_login_time:
+            return None
+
+        value = await request.session.aget(self.login_time_key)
+        return None if value is None else decode_timestamp(value)
+
+    def set_login_time(self, request: HttpRequest, current_time: datetime) -> None:
+        # It's called on login, the session is saved anyway.
+        request.session[self.login_time_key] = encode_timestamp(current_time, self.config.timestamp_format)
+
+    def get_login_timestamp(self, request: HttpRequest) -> Optional[float]:
+        """
+        Get the login time of this session or the last login time of the user.
+        :return: float - seconds since epoch | None - if the user has never logged in
+        """
+        login_time = self.get_login_time(request)
+        if login_time is None and request.user.last_login is not None:
+            return request.user.last_login.timestamp()
+
+        return login_time
+
+    def get_last_request(self, request: HttpRequest) -> Optional[float]:
+        """
+        :return: float - seconds since epoch | None - if there is no stored time yet
+        """
+        raise NotImplementedError
+
+    def should_update(self, request: HttpRequest, current_time: datetime) -> bool:
+        """
+        Check if the time of the last request is older than `IDLE_TIME_RESOLUTION`.
+        """
+        resolution = self.config.idle_time_resolution
+        if resolution is None:
+            return True
+
+        last_request = self.get_last_request(request)
+        return last_request is None or current_time.timestamp() - last_request >= resolution.total_seconds()
+
+    def get_guard_key(self, request: HttpRequest) -> Optional[str]:
+        session_key = request.session.session_key
+        return f'{self.guard_key_prefix}:{session_key}' if session_key else None
+
+    def claim_write(self, request: HttpRequest, current_time: datetime) -> bool:
+        """
+        Check that no other request of the session stores the time in this `IDLE_TIME_RESOLUTION` window,
+        see `ACTIVITY_WRITE_GUARD`. `cache.add` is atomic, so parallel requests store the time once.
+        """
+        if not self.config.write_guard:
+            return True
+
+        key = self.get_guard_key(request)
+        if key is None:
+            return True
+
+        return self.get_cache().add(key, current_time.timestamp(), self.config.idle_time_resolution.total_seconds())
+
+    async def aclaim_write(self, request: HttpRequest, current_time: datetime) -> bool:
+        if not self.config.write_guard:
+            return True
+
+        key = self.get_guard_key(request)
+        if key is None:
+            return True
+
+        return await self.get_cache().aadd(
+            key, current_time.timestamp(), self.config.idle_time_resolution.total_seconds(),
+        )
+
+    def set_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        raise NotImplementedError
+
+    async def aset_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        """
+        Store the time from async code. Stores that keep it in the request (session, cookie) don't block.
+        """
+        self.set_last_request(request, current_time)
+
+    def delete_last_request(self, request: HttpRequest) -> None:
+        raise NotImplementedError
+
+    async def adelete_last_request(self, request: HttpRequest) -> None:
+        self.delete_last_request(request)
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> None:
+        """
+        Called by the middleware with the response of every checked request, e.g. to set cookies.
+        """
+
+
+class SessionActivityStore(ActivityStore):
+    """
+    Keeps the time of the last request in the session (default).
+    """
+    key = 'django_auto_logout_last_request'
+
+    async def aload(self, request: HttpRequest) -> None:
+        await request.session.aget(self.key)
+
+    def get_last_request(self, request: HttpRequest) -> Optional[float]:
+        return last_request_timestamp(request)
+
+    def should_update(self, request: HttpRequest, current_time: datetime) -> bool:
+        return should_update_last_request(
+            request, self.config.idle_time_resolution, current_time, self.config.timestamp_format,
+        )
+
+    def set_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        request.session[self.key] = encode_timestamp(current_time, self.config.timestamp_format)
+
+    def delete_last_request(self, request: HttpRequest) -> None:
+        request.session.pop(self.key, None)
+
+
+class CacheActivityStore(ActivityStore):
+    """
+    Keeps the time of the last request in the Django cache, so requests don't save the session.
+    Every session (or user, see `ACTIVITY_KEY`) has a key that expires in `IDLE_TIME`.
+
+    If there is no key, the user is idle since the last login: make sure the cache doesn't evict keys
+    before they expire (e.g. `MAX_ENTRIES` of the local-memory cache is big enough).
+    """
+    key_prefix = 'django_auto_logout:last_request'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.per_user = config.options.get('ACTIVITY_KEY', 'session') == 'user'
+        self.timeout = config.idle_time.total_seconds() if config.idle_time is not None else None
+
+    def get_key(self, request: HttpRequest) -> Optional[str]:
+        if self.per_user:
+            # The id in the session, so the user isn't loaded (or resolved in the event loop).
+            user_id = request.session.get(SESSION_KEY)
+            return f'{self.key_prefix}:user:{user_id}' if user_id is not None else None
+
+        session_key = request.session.session_key
+        return f'{self.key_prefix}:{session_key}' if session_key else None
+
+    def get_guard_key(self, request: HttpRequest) -> Optional[str]:
+        if self.per_user:
+            user_id = request.session.get(SESSION_KEY)
+            return f'{self.guard_key_prefix}:user:{user_id}' if user_id is not None else None
+        return super().get_guard_key(request)
+
+    def get_value(self, key: str) -> Optional[float]:
+        return self.get_cache().get(key)
+
+    async def aget_value(self, key: str) -> Optional[float]:
+        return await self.get_cache().aget(key)
+
+    def set_value(self, key: str, value: float) -> None:
+        self.get_cache().set(key, value, self.timeout)
+
+    async def aset_value(self, key: str, value: float) -> None:
+        await self.get_cache().aset(key, value, self.timeout)
+
+    def delete_value(self, key: str) -> None:
+        self.get_cache().delete(key)
+
+    async def adelete_value(self, key: str) -> None:
+        await self.get_cache().adelete(key)
+
+    async def aload(self, request: HttpRequest) -> None:
+        if self.per_user:
+            await request.session.aget(SESSION_KEY)  # `get_key` reads the loaded session
+        key = self.get_key(request)
+        request._django_auto_logout_last_request = None if key is None else await self.aget_value(key)
+
+    def get_last_request(self, request: HttpRequest) -> Optional[float]:
+        # The value is cached in the request: the middleware and the context processor read it both.
+        last_request = getattr(request, '_django_auto_logout_last_request', _NOT_LOADED)
+        if last_request is _NOT_LOADED:
+            key = self.get_key(request)
+            last_request = None if key is None else self.get_value(key)
+            request._django_auto_logout_last_request = last_request
+
+        # The user isn't idle since the login: the key may be evicted or left from a previous login.
+        login_time = self.get_login_timestamp(request)
+        if login_time is not None:
+            return max(last_request or 0, login_time)
+
+        return last_request
+
+    def set_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        key = self.get_key(request)
+        if key is not None:
+            request._django_auto_logout_last_request = current_time.timestamp()
+            self.set_value(key, request._django_auto_logout_last_request)
+
+    async def aset_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        key = self.get_key(request)
+        if key is not None:
+            request._django_auto_logout_last_request = current_time.timestamp()
+            await self.aset_value(key, request._django_auto_logout_last_request)
+
+    def delete_last_request(self, request: HttpRequest) -> None:
+        key = self.get_key(request)
+        if key is not None:
+            request._django_auto_logout_last_request = None
+            self.delete_value(key)
+
+    async def adelete_last_request(self, request: HttpRequest) -> None:
+        key = self.get_key(request)
+        if key is not None:
+            request._django_auto_logout_last_request = None
+            await self.adelete_value(key)
+
+
+class BufferedCacheActivityStore(CacheActivityStore):
+    """
+    `CacheActivityStore` that keeps the latest time of every key in memory
+    and writes them to the cache with one `set_many` call: every `ACTIVITY_FLUSH_INTERVAL`
+    seconds (in a background thread), when there are `ACTIVITY_BUFFER_SIZE` keys and on exit.
+
+    Other processes see the time up to `ACTIVITY_FLUSH_INTERVAL` later, so the interval
+    should be much less than `IDLE_TIME`.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.flush_interval = config.options.get('ACTIVITY_FLUSH_INTERVAL', 5)
+        self.buffer_size = config.options.get('ACTIVITY_BUFFER_SIZE', 1000)
+        if self.timeout is not None and self.flush_interval * 10 > self.timeout:
+            raise ImproperlyConfigured("ACTIVITY_FLUSH_INTERVAL should be at most a tenth of IDLE_TIME")
+
+        self._buffer = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        _buffered_stores.add(self)
+
+    def get_value(self, key: str) -> Optional[float]:
+        value = self._buffer.get(key)
+        return super().get_value(key) if value is None else value
+
+    async def aget_value(self, key: str) -> Optional[float]:
+        value = self._buffer.get(key)
+        return await super().aget_value(key) if value is None else value
+
+    def _buffer_value(self, key: str, value: float) -> bool:
+        """
+        :return: bool - the buffer is full and should be flushed
+        """
+        with self._lock:
+            self._buffer[key] = value
+            is_full = len(self._buffer) >= self.buffer_size
+
+            # The timer runs only while there is something to flush.
+            if self._timer is None and not is_full:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        return is_full
+
+    def set_value(self, key: str, value: float) -> None:
+        if self._buffer_value(key, value):
+            self.flush()
+
+    async def aset_value(self, key: str, value: float) -> None:
+        if self._buffer_value(key, value):
+            await self.aflush()
+
+    def delete_value(self, key: str) -> None:
+        with self._lock:
+            self._buffer.pop(key, None)
+        super().delete_value(key)
+
+    async def adelete_value(self, key: str) -> None:
+        with self._lock:
+            self._buffer.pop(key, None)
+        await super().adelete_value(key)
+
+    def _take_buffer(self) -> dict:
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return buffer
+
+    def flush(self) -> None:
+        """
+        Write the buffered times to the cache.
+        """
+        buffer = self._take_buffer()
+        if buffer:
+            self.get_cache().set_many(buffer, self.timeout)
+
+    async def aflush(self) -> None:
+        buffer = self._take_buffer()
+        if buffer:
+            await self.get_cache().aset_many(buffer, self.timeout)
+
+
+_buffered_stores = WeakSet()
+
+
+@atexit.register
+def _flush_buffered_stores() -> None:
+    for store in list(_buffered_stores):
+        store.flush()
+
+
+def _encode_deciseconds(value: Optional[float]) -> str:
+    return '' if value is None else b62_encode(int(value * 10))
+
+
+def _decode_deciseconds(value: str) -> Optional[float]:
+    return b62_decode(value) / 10 if value else None
+
+
+class SignedCookieActivityStore(ActivityStore):
+    """
+    Keeps the time of the last request and the login (see `STORE_LOGIN_TIME`) in a signed cookie,
+    so any node checks `IDLE_TIME` with one HMAC check and without a shared store or a session save.
+
+    The cookie is bound to the user, signed with `SECRET_KEY` (rotate it with `SECRET_KEY_FALLBACKS`)
+    and rewritten once in `IDLE_TIME_RESOLUTION`. If there is no valid cookie,
+    the user is idle since the last login.
+    """
+    salt = 'django_auto_logout.activity'
+    is_server_side = False
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.cookie_name = config.options.get('ACTIVITY_COOKIE_NAME', 'auto_logout_activity')
+
+    def _read_cookie(self, request: HttpRequest, user_id) -> Tuple[Optional[float], Optional[float]]:
+        value = request.COOKIES.get(self.cookie_name)
+        if not value or user_id is None:
+            return None, None
+
+        try:
+            cookie_user_id, last_request, login_time = signing.Signer(salt=self.salt).unsign(value).rsplit(':', 2)
+        except (signing.BadSignature, ValueError):
+            return None, None
+
+        if cookie_user_id != str(user_id):  # a cookie of another user
+            return None, None
+
+        return _decode_deciseconds(last_request), _decode_deciseconds(login_time)
+
+    def _get_times(self, request: HttpRequest) -> Tuple[Optional[float], Optional[float]]:
+        # The cookie is checked once per request.
+        times = getattr(request, '_django_auto_logout_cookie', _NOT_LOADED)
+        if times is _NOT_LOADED:
+            times = request._django_auto_logout_cookie = self._read_cookie(request, request.session.get(SESSION_KEY))
+        return times
+
+    def _set_times(self, request: HttpRequest, last_request: Optional[float], login_time: Optional[float]) -> None:
+        request._django_auto_logout_cookie = (last_request, login_time)
+        request._django_auto_logout_cookie_changed = True
+
+    async def aload(self, request: HttpRequest) -> None:
+        if not hasattr(request, '_django_auto_logout_cookie'):
+            request._django_auto_logout_cookie = self._read_cookie(request, await request.session.aget(SESSION_KEY))
+
+    def get_login_time(self, request: HttpRequest) -> Optional[float]:
+        return self._get_times(request)[1] if self.config.store_login_time else None
+
+    async def aget_login_time(self, request: HttpRequest) -> Optional[float]:
+        await self.aload(request)
+        return self.get_login_time(request)
+
+    def set_login_time(self, request: HttpRequest, current_time: datetime) -> None:
+        timestamp = current_time.timestamp()
+        self._set_times(request, timestamp, timestamp)
+
+    def get_last_request(self, request: HttpRequest) -> Optional[float]:
+        last_request = self._get_times(request)[0]
+
+        # The cookie may be missing or removed by the user: then the user is idle since the login.
+        login_time = self.get_login_timestamp(request)
+        if login_time is not None:
+            return max(last_request or 0, login_time)
+
+        return last_request
+
+    def set_last_request(self, request: HttpRequest, current_time: datetime) -> None:
+        self._set_times(request, current_time.timestamp(), self._get_times(request)[1])
+
+    def delete_last_request(self, request: HttpRequest) -> None:
+        self._set_times(request, None, None)
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> None:
+        if not getattr(request, '_django_auto_logout_cookie_changed', False):
+            return
+
+        last_request, login_time = request._django_auto_logout_cookie
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is None or (last_request is None and login_time is None):
+            response.delete_cookie(
+                self.cookie_name, path=settings.SESSION_COOKIE_PATH, domain=settings.SESSION_COOKIE_DOMAIN,
+            )
+            return
+
+        value = f'{user_id}:{_encode_deciseconds(last_request)}:{_encode_deciseconds(login_time)}'
+        response.set_cookie(
+            self.cookie_name,
+            signing.Signer(salt=self.salt).sign(value),
+            max_age=None if settings.SESSION_EXPIRE_AT_BROWSER_CLOSE else settings.SESSION_COOKIE_AGE,
+            path=settings.SESSION_COOKIE_PATH,
+            domain=settings.SESSION_COOKIE_DOMAIN,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'django_auto_logout'
+
+urlpatterns = [
+    path('events/', views.events, name='events'),
+    path('heartbeat/', views.heartbeat, name='heartbeat'),
+    path('poll/', views.poll, name='poll'),
+    path('remaining/', views.remaining, name='remaining'),
+    path('sessions/', views.sessions_report, name='sessions_report'),
+]
@@ -1,57 +1,231 @@
 from datetime import datetime, timedelta
-from typing import Union
+from typing import Optional, Sequence, Tuple, Union
 from django.http import HttpRequest
-from django.utils.timezone import now
 
-now = now
+from .clock import get_clock
+
+try:
+    import numpy
+except ImportError:  # optional, see `bulk_logout_deadlines`
+    numpy = None
+
+
+def now() -> datetime:
+    """
+    Get the current time of auto logout: of `override_clock`, `AUTO_LOGOUT['CLOCK']` or the system time.
+    :return: datetime
+    """
+    return get_clock().now()
+
+
+def has_async_session(request: HttpRequest) -> bool:
+    """
+    Check if the session and the user can be loaded without blocking the event loop:
+    `SessionBase.aget` is in Django 5.1+ (`auser` and `alogout` are in 5.0).
+    """
+    return hasattr(request.session, 'aget')
+
+
+def session_time_to_timedelta(session_time: Union[int, timedelta]) -> timedelta:
+    """
+    Validate `AUTO_LOGOUT['SESSION_TIME']` and convert it to timedelta.
+    :param session_time: int - for seconds | timedelta
+    :return: timedelta
+    """
+    if isinstance(session_time, timedelta):
+        return session_time
+    elif isinstance(session_time, int):
+        return timedelta(seconds=session_time)
+
+    raise TypeError(f"AUTO_LOGOUT['SESSION_TIME'] should be `int` or `timedelta`, "
+                    f"not `{type(session_time).__name__}` ({session_time}).")
+
+
+def idle_time_to_timedelta(idle_time: Union[int, timedelta], setting: str = 'IDLE_TIME') -> timedelta:
+    """
+    Validate `AUTO_LOGOUT['IDLE_TIME']` (or another idle setting) and convert it to timedelta.
+    :param idle_time: int - for seconds | timedelta
+    :param setting: str - the name of the setting for the error message
+    :return: timedelta
+    """
+    if isinstance(idle_time, timedelta):
+        return idle_time
+    elif isinstance(idle_time, int):
+        return timedelta(seconds=idle_time)
+
+    raise TypeError(f"AUTO_LOGOUT['{setting}'] should be `int` or `timedelta`, "
+                    f"not `{type(idle_time).__name__}`.")
 
 
 def seconds_until_session_end(
     request: HttpRequest,
     session_time: Union[int, timedelta],
-    current_time: datetime
+    current_time: datetime,
+    activity_store=None
 ) -> float:
     """
     Get seconds until the end of the session.
     :param request: django.http.HttpRequest
     :param session_time: int - for seconds | timedelta
     :param current_time: datetime - use django_auto_logout.utils.now
+    :param activity_store: django_auto_logout.stores.ActivityStore | None - to use the login time of the session
     :return: float
     """
-    if isinstance(session_time, timedelta):
-        ttl = session_time
-    elif isinstance(session_time, int):
-        ttl = timedelta(seconds=session_time)
-    else:
-        raise TypeError(f"AUTO_LOGOUT['SESSION_TIME'] should be `int` or `timedelta`, "
-                        f"not `{type(session_time).__name__}` ({session_time}).")
+    ttl = session_time_to_timedelta(session_time)
+    login_time = None if activity_store is None else activity_store.get_login_time(request)
+    if login_time is None:
+        return (request.user.last_login - current_time + ttl).total_seconds()
 
-    return (request.user.last_login - current_time + ttl).total_seconds()
+    return login_time - current_time.timestamp() + ttl.total_seconds()
 
 
 def seconds_until_idle_time_end(
     request: HttpRequest,
     idle_time: Union[int, timedelta],
-    current_time: datetime
+    current_time: datetime,
+    activity_store=None
 ) -> float:
     """
     Get seconds until the end of downtime.
     :param request: django.http.HttpRequest
     :param idle_time: int - for seconds | timedelta
     :param current_time: datetime - use django_auto_logout.utils.now
+    :param activity_store: django_auto_logout.stores.ActivityStore | None - for the session
     :return: float
     """
-    if isinstance(idle_time, timedelta):
-        ttl = idle_time
-    elif isinstance(idle_time, int):
-        ttl = timedelta(seconds=idle_time)
+    ttl = idle_time_to_timedelta(idle_time).total_seconds()
+    if activity_store is None:
+        last_req = last_request_timestamp(request)
     else:
-        raise TypeError(f"AUTO_LOGOUT['IDLE_TIME'] should be `int` or `timedelta`, "
-                        f"not `{type(idle_time).__name__}`.")
+        last_req = activity_store.get_last_request(request)
+    if last_req is None:
+        return ttl
 
-    if 'django_auto_logout_last_request' in request.session:
-        last_req = datetime.fromisoformat(request.session['django_auto_logout_last_request'])
-    else:
-        last_req = current_time
+    return last_req - current_time.timestamp() + ttl
+
+
+def seconds_until_logout(request: HttpRequest, config, current_time: datetime) -> Optional[float]:
+    """
+    Get seconds until the session or idle time ends, whichever is first.
+    :param request: django.http.HttpRequest - with the user and the session
+    :param config: django_auto_logout.conf.AutoLogoutConfig
+    :param current_time: datetime - use django_auto_logout.utils.now
+    :return: float - negative if it has ended | None - if there are no time limits
+    """
+    seconds = []
+    if config.session_time is not None:
+        seconds.append(seconds_until_session_end(request, config.session_time, current_time, config.activity_store))
+    if config.idle_time is not None:
+        seconds.append(seconds_until_idle_time_end(request, config.idle_time, current_time, config.activity_store))
+    return min(seconds) if seconds else None
+
+
+def bulk_logout_deadlines(
+    login_times: Sequence[Optional[float]],
+    last_requests: Sequence[Optional[float]],
+    current_time: datetime,
+    session_time: Union[None, int, timedelta] = None,
+    idle_time: Union[None, int, timedelta] = None,
+    within: Union[int, float, timedelta] = 0,
+) -> Tuple[Sequence[float], Sequence[bool]]:
+    """
+    Get the logout times of many sessions in one pass, the same as `seconds_until_logout` for every one.
+    Uses NumPy if it's installed.
+    :param login_times: float - seconds since epoch (see `ActivityStore.get_login_timestamp`) | None, for every session
+    :param last_requests: float - seconds since epoch | None - if there is no stored time yet, for every session
+    :param current_time: datetime - use django_auto_logout.utils.now
+    :param session_time: int - for seconds | timedelta | None - no limit
+    :param idle_time: int - for seconds | timedelta | None - no limit
+    :param within: int, float - for seconds | timedelta - to find sessions ending soon
+    :return: tuple - deadlines (seconds since epoch, `inf` if there are no limits)
+        and if they are before `current_time + within`: numpy.ndarray with NumPy, lists otherwise
+    """
+    current = current_time.timestamp()
+    session_seconds = None if session_time is None else session_time_to_timedelta(session_time).total_seconds()
+    idle_seconds = None if idle_time is None else idle_time_to_timedelta(idle_time).total_seconds()
+    until = current + (within.total_seconds() if isinstance(within, timedelta) else within)
+
+    if numpy is not None:
+        deadlines = numpy.full(len(login_times), numpy.inf)
+        if session_seconds is not None:
+            # None is NaN, `fmin` ignores it.
+            deadlines = numpy.fmin(deadlines, numpy.asarray(login_times, dtype=float) + session_seconds)
+        if idle_seconds is not None:
+            last = numpy.asarray(last_requests, dtype=float)
+            deadlines = numpy.fmin(deadlines, numpy.where(numpy.isnan(last), current, last) + idle_seconds)
+        return deadlines, deadlines < until
+
+    deadlines = []
+    for login_time, last_request in zip(login_times, last_requests):
+        deadline = float('inf')
+        if session_seconds is not None and login_time is not None:
+            deadline = login_time + session_seconds
+        if idle_seconds is not None:
+            deadline = min(deadline, (current if last_request is None else last_request) + idle_seconds)
+        deadlines.append(deadline)
+
+    return deadlines, [deadline < until for deadline in deadlines]
+
+
+def encode_timestamp(current_time: datetime, timestamp_format: str = 'iso') -> Union[str, int]:
+    """
+    Convert the time to store it in the session.
+    :param current_time: datetime - use django_auto_logout.utils.now
+    :param timestamp_format: str - 'iso' | 'seconds' | 'deciseconds' (since epoch)
+    :return: str | int
+    """
+    if timestamp_format == 'seconds':
+        return int(current_time.timestamp())
+    elif timestamp_format == 'deciseconds':
+        return int(current_time.timestamp() * 10)
+    return current_time.isoformat()
+
+
+def decode_timestamp(value: Union[str, int]) -> float:
+    """
+    Convert the stored time (in any format) to seconds since epoch.
+    :param value: str - ISO 8601 | int - seconds or deciseconds since epoch
+    :return: float
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+
+    # Deciseconds are >= 10 ** 10 since 2001, seconds will be only in 2286.
+    return value / 10 if value >= 10 ** 10 else float(value)
+
+
+def last_request_timestamp(request: HttpRequest) -> Optional[float]:
+    """
+    Get the time of the last request stored in the session.
+    :param request: django.http.HttpRequest
+    :return: float - seconds since epoch | None - if there is no stored time yet
+    """
+    value = request.session.get('django_auto_logout_last_request')
+    return None if value is None else decode_timestamp(value)
+
+
+def should_update_last_request(
+    request: HttpRequest,
+    idle_time_resolution: Union[None, int, timedelta],
+    current_time: datetime,
+    timestamp_format: str = 'iso'
+) -> bool:
+    """
+    Check if the time of the last request should be rewritten in the session.
+    The time is not rewritten (and the session is not saved) until it is
+    older than `idle_time_resolution` or stored in another format.
+    :param request: django.http.HttpRequest
+    :param idle_time_resolution: None - rewrite on every request | int - for seconds | timedelta
+    :param current_time: datetime - use django_auto_logout.utils.now
+    :param timestamp_format: str - the format to store the time, see `encode_timestamp`
+    :return: bool
+    """
+    if not idle_time_resolution:
+        return True
+
+    value = request.session.get('django_auto_logout_last_request')
+    if value is None or isinstance(value, str) != (timestamp_format == 'iso'):
+        return True
 
-    return (last_req - current_time + ttl).total_seconds()
+    resolution = idle_time_to_timedelta(idle_time_resolution, 'IDLE_TIME_RESOLUTION')
+    return current_time.timestamp() - decode_timestamp(value) >= resolution.total_seconds()
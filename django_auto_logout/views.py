@@ -0,0 +1,277 @@
+import json
+from typing import Tuple
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.crypto import salted_hmac
+from django.views.decorators.http import require_POST
+
+from .conf import AutoLogoutConfig, get_config
+from .policies import aresolve_config, resolve_config
+from .push import Event, registry
+from .sessions import get_db_session_store, iter_deadlines, iter_session_chunks
+from .utils import (
+    has_async_session, now, seconds_until_idle_time_end, seconds_until_logout, seconds_until_session_end,
+)
+
+# Seconds to wait for an event before a keep-alive comment (events) or an empty response (poll).
+KEEPALIVE = 15
+POLL_TIMEOUT = 25
+
+# Sessions per query of `sessions_report`.
+REPORT_CHUNK_SIZE = 2000
+
+
+async def _aload(request: HttpRequest, config: AutoLogoutConfig) -> AutoLogoutConfig:
+    """
+    Load the user, the policy and the activity without blocking the event loop.
+    :return: AutoLogoutConfig - with the policy of the user
+    """
+    request.user = await request.auser()
+    config = await aresolve_config(request, config)
+    await config.activity_store.aload(request)
+    return config
+
+
+def _get_state(request: HttpRequest, config: AutoLogoutConfig) -> Tuple[str, dict]:
+    if request.user.is_anonymous:
+        return 'logout', {}
+
+    config = resolve_config(request, config)
+    current_time = now()
+    seconds = seconds_until_logout(request, config, current_time)
+    if seconds is None:
+        return 'deadline', {'deadline': None}
+    if seconds < 0:
+        return 'logout', {}
+    return 'deadline', {'deadline': current_time.timestamp() + seconds}
+
+
+async def _aget_state(request: HttpRequest, config: AutoLogoutConfig) -> Tuple[str, dict]:
+    if not has_async_session(request):
+        # Django < 5.1 can't load the session asynchronously.
+        return await sync_to_async(_get_state)(request, config)
+
+    return _get_state(request, await _aload(request, config))
+
+
+def _get_config() -> AutoLogoutConfig:
+    config = get_config()
+    if config is None:
+        raise Http404('Auto logout settings are not specified')
+    return config
+
+
+async def _ais_authenticated(request: HttpRequest) -> bool:
+    if not has_async_session(request):
+        # Django < 5.1 can't load the session asynchronously.
+        return await sync_to_async(lambda: request.user.is_authenticated)()
+
+    request.user = await request.auser()
+    return request.user.is_authenticated
+
+
+async def _aopen(request: HttpRequest, config: AutoLogoutConfig) -> Event:
+    """
+    Start listening to the session and get its current state.
+    Channels are opened only for logged in sessions, so made-up session keys of clients
+    don't take the places of real listeners in the registry.
+    """
+    session_key = request.session.session_key
+    if not session_key or not await _ais_authenticated(request):
+        return Event(0, 'logout', {})
+
+    after = registry.open(session_key)
+    name, data = await _aget_state(request, config)
+    if name == 'logout':
+        registry.close(session_key)
+    return Event(after, name, data)
+
+
+def _format_event(event: Event) -> str:
+    return f"id: {event.id}\nevent: {event.name}\ndata: {json.dumps(event.data)}\n\n"
+
+
+async def events(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Server-Sent Events with the logout time of the session:
+    `deadline` (seconds since epoch in `data.deadline`) on every update and `logout` at the end.
+    Add the path to `EXCLUDE_PATHS`, so listening isn't counted as activity.
+    """
+    config = _get_config()
+    session_key = request.session.session_key
+    first = await _aopen(request, config)
+
+    async def stream():
+        event, last_id = first, first.id
+        while True:
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield _format_event(event)
+                if event.name == 'logout':
+                    return
+                last_id = event.id
+
+            if session_key not in registry:
+                return  # forgotten: the browser reconnects and opens it again
+            event = await registry.wait(session_key, last_id, KEEPALIVE)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    add_never_cache_headers(response)
+    response['X-Accel-Buffering'] = 'no'  # nginx shouldn't buffer the stream
+    return response
+
+
+async def poll(request: HttpRequest) -> HttpResponse:
+    """
+    Long-poll fallback of `events`. Without `after` it returns the current state at once,
+    otherwise it waits for an event with a greater `id` up to `POLL_TIMEOUT` seconds (204 on timeout).
+    """
+    config = _get_config()
+    session_key = request.session.session_key
+
+    try:
+        after = int(request.GET['after']) if 'after' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest('`after` should be an event id')
+
+    if after is None or not session_key or session_key not in registry:
+        event = await _aopen(request, config)
+    else:
+        # Only logged in sessions wait.
+        name, data = await _aget_state(request, config)
+        if name == 'logout':
+            registry.close(session_key)
+            event = Event(after, name, data)
+        else:
+            event = await registry.wait(session_key, after, POLL_TIMEOUT)
+
+    if event is None:
+        response = HttpResponse(status=204)
+    else:
+        response = JsonResponse({'id': event.id, 'event': event.name, **event.data})
+    add_never_cache_headers(response)
+    return response
+
+
+def _get_remaining(request: HttpRequest, config: AutoLogoutConfig) -> dict:
+    if request.user.is_anonymous:
+        return {'logged_in': False}
+
+    config = resolve_config(request, config)
+    data = {'logged_in': True}
+    current_time = getattr(request, '_django_auto_logout_now', None) or now()
+
+    if config.session_time is not None:
+        seconds = seconds_until_session_end(request, config.session_time, current_time, config.activity_store)
+        data['seconds_until_session_end'] = seconds
+        data['session_end_at'] = round(current_time.timestamp() + seconds, 3)
+
+    if config.idle_time is not None:
+        seconds = seconds_until_idle_time_end(request, config.idle_time, current_time, config.activity_store)
+        data['seconds_until_idle_end'] = seconds
+        data['idle_end_at'] = round(current_time.timestamp() + seconds, 3)
+
+    return data
+
+
+def _remaining_response(request: HttpRequest, data: dict) -> HttpResponse:
+    # The deadlines (seconds since epoch) change only with activity, so they are the ETag.
+    # The login state and the session (its key changes on login) keep anonymous responses
+    # and responses without limits from matching after login.
+    session_key = getattr(getattr(request, 'session', None), 'session_key', None) or ''
+    etag = 'W/"{}-{}-{}-{}"'.format(
+        int(data['logged_in']),
+        salted_hmac('django_auto_logout.remaining', session_key).hexdigest()[:16],
+        data.get('session_end_at', ''),
+        data.get('idle_end_at', ''),
+    )
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def remaining(request: HttpRequest) -> HttpResponse:
+    """
+    Seconds until the session and idle time end (`seconds_until_*`)
+    and the deadlines in seconds since epoch (`*_end_at`) for JS clients.
+    Send `X-Auto-Logout-Passive: 1`, so polling doesn't count as activity,
+    and `If-None-Match`, to get `304 Not Modified` while the deadlines are the same.
+    """
+    return _remaining_response(request, _get_remaining(request, _get_config()))
+
+
+async def aremaining(request: HttpRequest) -> HttpResponse:
+    """
+    Async `remaining` for ASGI.
+    """
+    config = _get_config()
+    if not has_async_session(request):
+        # Django < 5.1 can't load the session asynchronously.
+        data = await sync_to_async(_get_remaining)(request, config)
+    else:
+        data = _get_remaining(request, await _aload(request, config))
+
+    return _remaining_response(request, data)
+
+
+@require_POST
+def heartbeat(request: HttpRequest) -> HttpResponse:
+    """
+    Activity of the user on a page (see `CLIENT_HEARTBEAT`): the middleware stores the time of the request
+    as for any other one, with `IDLE_TIME_RESOLUTION` and `ACTIVITY_WRITE_GUARD`, and the view only answers
+    `204 No Content` with the new logout time in `X-Auto-Logout-Deadline` (seconds since epoch, if any).
+    The request shouldn't be excluded or passive (e.g. with `EXCLUDE_PATHS` or `PASSIVE_METHODS`).
+    """
+    config = _get_config()
+    if request.user.is_anonymous:
+        return HttpResponseForbidden()
+
+    config = resolve_config(request, config)
+    current_time = getattr(request, '_django_auto_logout_now', None) or now()
+    seconds = seconds_until_logout(request, config, current_time)
+
+    response = HttpResponse(status=204)
+    if seconds is not None:
+        response['X-Auto-Logout-Deadline'] = str(round(current_time.timestamp() + seconds, 3))
+    add_never_cache_headers(response)
+    return response
+
+
+def sessions_report(request: HttpRequest) -> HttpResponse:
+    """
+    Staff-only report of the sessions in the database: logged in users (`sessions`)
+    and sessions which end in `within` seconds (`expiring`, 300 by default, expired ones too).
+    It reads all the sessions in chunks of `REPORT_CHUNK_SIZE`, so it isn't for frequent polling.
+    """
+    if not (request.user.is_active and request.user.is_staff):
+        raise PermissionDenied
+
+    config = _get_config()
+    store_cls = get_db_session_store()
+    if store_cls is None:
+        return HttpResponseBadRequest("The session engine doesn't store sessions in the database")
+    if not config.activity_store.is_server_side:
+        return HttpResponseBadRequest("ACTIVITY_STORE keeps the activity on the client")
+
+    try:
+        within = float(request.GET.get('within', 300))
+    except ValueError:
+        return HttpResponseBadRequest('`within` should be seconds')
+
+    current_time = now()
+    sessions = expiring = 0
+    for _, requests in iter_session_chunks(store_cls, REPORT_CHUNK_SIZE, config):
+        sessions += len(requests)
+        for _, _, batch_expiring in iter_deadlines(requests, config, current_time, within):
+            expiring += int(sum(batch_expiring))
+
+    response = JsonResponse({'sessions': sessions, 'expiring': expiring, 'within': within})
+    add_never_cache_headers(response)
+    return response
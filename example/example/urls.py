@@ -1,10 +1,14 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
-from some_app_login_required.views import UserLoginView, login_required_view
+from django_auto_logout.views import aremaining
+from some_app_login_required.views import UserLoginView, healthz_view, login_required_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('login/', UserLoginView.as_view()),
     path('login-required/', login_required_view),
+    path('healthz/', healthz_view, name='healthz'),
+    path('auto-logout/', include('django_auto_logout.urls')),
+    path('auto-logout-async/remaining/', aremaining),
 ]
@@ -1,20 +1,85 @@
+import asyncio
+import json
 import logging
-from time import sleep
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+from unittest import mock, skipUnless
 from datetime import timedelta
-from django.test import TestCase
+from io import StringIO
+from asgiref.sync import sync_to_async
+import django
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.template import RequestContext, Template
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, logout
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+
+from django_auto_logout import __version__, utils
+from django_auto_logout.clock import OffsetClock, VirtualClock, get_clock, override_clock, system_clock
+from django_auto_logout.conf import get_config
+from django_auto_logout.context_processors import LOGOUT_TIMEOUT_SCRIPT_PATTERN, _trim, auto_logout_client
+from django_auto_logout.deadlines import DeadlineCache
+from django_auto_logout.metrics import MetricsExporter, metrics
+from django_auto_logout.policies import PolicyCache, group_policy
+from django_auto_logout.push import Registry, registry
+from django_auto_logout.simulation import replay
+from django_auto_logout.stores import BufferedCacheActivityStore, _encode_deciseconds
+from django_auto_logout.utils import encode_timestamp
+
+try:
+    from django.contrib.auth import alogout
+except ImportError:  # Django < 5.0, see `requires_async_auth`
+    alogout = None
 
 UserModel = get_user_model()
 logger = logging.getLogger(__name__)
 
+ASYNC_MIDDLEWARE = [
+    m if m != 'django_auto_logout.middleware.auto_logout' else 'django_auto_logout.middleware.async_auto_logout'
+    for m in settings.MIDDLEWARE
+]
+
+# `aforce_login` is in Django 5.0+, `aiter` and `anext` are in Python 3.10+.
+requires_async_auth = skipUnless(django.VERSION >= (5, 0), 'Async login needs Django 5.0+')
+requires_anext = skipUnless(sys.version_info >= (3, 10), '`aiter` and `anext` need Python 3.10+')
+# The async middleware checks in a thread on Django < 5.1, see `has_async_session`.
+requires_async_session = skipUnless(django.VERSION >= (5, 1), 'Django < 5.1 checks in a thread')
+
 
 class TestAutoLogout(TestCase):
     def setUp(self):
+        # Waits move the clock of auto logout instead of sleeping.
+        self.clock = OffsetClock()
+        clock_override = override_clock(self.clock)
+        clock_override.__enter__()
+        self.addCleanup(clock_override.__exit__, None, None, None)
+
+        # Django stores `last_login` in the system time.
+        def update_last_login(sender, user, **kwargs):
+            user.last_login = self.clock.now()
+            user.save(update_fields=['last_login'])
+
+        user_logged_in.connect(update_last_login, weak=False)
+        self.addCleanup(user_logged_in.disconnect, update_last_login)
+
         self.user = UserModel.objects.create_user('user', 'user@localhost', 'pass')
         self.superuser = UserModel.objects.create_superuser('superuser', 'superuser@localhost', 'pass')
         self.url = '/login-required/'
 
+    def sleep(self, seconds: float) -> None:
+        self.clock.advance(seconds)
+
     def assertLoginRequiredIsOk(self):
         resp = self.client.get(self.url)
         self.assertContains(resp, 'login required view', msg_prefix='Fine with authorized')
@@ -34,7 +99,7 @@ class TestAutoLogoutSessionTime(TestAutoLogout):
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
 
-        sleep(1)
+        self.sleep(1)
         self.assertLoginRequiredRedirect()
 
     def test_logout_session_time(self):
@@ -86,13 +151,70 @@ class TestAutoLogoutSessionTime(TestAutoLogout):
 
         logger.info("FYI! IT'S OK - END (Session time is wrong)")
 
+class TestAutoLogoutStoreLoginTime(TestAutoLogout):
+    def test_logout_session_time(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 1, 'STORE_LOGIN_TIME': True}
+        self.client.force_login(self.user)
+        self.assertIn('django_auto_logout_login_time', self.client.session)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(1)
+        self.assertLoginRequiredRedirect()
+
+    def test_session_time_per_session(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 1, 'STORE_LOGIN_TIME': True, 'TIMESTAMP_FORMAT': 'deciseconds'}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(0.6)
+        other_client = self.client_class()
+        other_client.force_login(self.user)  # updates `last_login`
+
+        self.sleep(0.6)
+        self.assertLoginRequiredRedirect()
+        self.assertContains(other_client.get(self.url), 'login required view')
+
+    def test_user_is_not_loaded(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 5,
+            'SESSION_TIME': 10,
+            'STORE_LOGIN_TIME': True,
+        }
+        self.client.force_login(self.user)
+        self.client.get('/healthz/')
+
+        with self.assertNumQueries(1):  # the session only
+            self.client.get('/healthz/')
+
+    def test_sessions_without_login_time(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 1}
+        self.client.force_login(self.user)
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 1, 'STORE_LOGIN_TIME': True}
+        self.assertNotIn('django_auto_logout_login_time', self.client.session)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(1)
+        self.assertLoginRequiredRedirect()
+
+    def test_cache_activity_store(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 1,
+            'STORE_LOGIN_TIME': True,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        self.client.force_login(self.user)
+        self.sleep(1)
+        self.assertLoginRequiredRedirect()
+
+
 class TestAutoLogoutIdleTime(TestAutoLogout):
     def _test_logout_idle_time_no_idle(self):
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
 
         for _ in range(10):
-            sleep(0.5)
+            self.sleep(0.5)
             self.assertLoginRequiredIsOk()
 
     def test_logout_idle_time_no_idle(self):
@@ -107,7 +229,7 @@ class TestAutoLogoutIdleTime(TestAutoLogout):
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
 
-        sleep(1.5)
+        self.sleep(1.5)
         self.assertLoginRequiredRedirect()
 
     def test_logout_idle_time(self):
@@ -134,6 +256,504 @@ class TestAutoLogoutIdleTime(TestAutoLogout):
         logger.info("FYI! IT'S OK - END (Checking wrong case)")
 
 
+class TestAutoLogoutIdleTimeResolution(TestAutoLogout):
+    def _last_request(self):
+        return self.client.session.get('django_auto_logout_last_request')
+
+    def test_last_request_is_not_rewritten_within_resolution(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': timedelta(seconds=0.5)}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        last_request = self._last_request()
+        self.assertIsNotNone(last_request)
+
+        for _ in range(5):
+            self.assertLoginRequiredIsOk()
+            self.assertEqual(self._last_request(), last_request)
+
+        self.sleep(0.5)
+        self.assertLoginRequiredIsOk()
+        self.assertGreater(self._last_request(), last_request)
+
+    def test_last_request_is_rewritten_on_every_request_without_resolution(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        last_request = self._last_request()
+
+        self.assertLoginRequiredIsOk()
+        self.assertGreater(self._last_request(), last_request)
+
+    def test_logout_idle_time_with_resolution(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'IDLE_TIME_RESOLUTION': 1}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(0.5)
+        self.assertLoginRequiredIsOk()
+        self.sleep(0.6)
+        self.assertLoginRequiredRedirect()
+
+    def test_idle_time_resolution_wrong_type(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'IDLE_TIME_RESOLUTION': '1'}
+        self.client.force_login(self.user)
+
+        exc_message = "AUTO_LOGOUT['IDLE_TIME_RESOLUTION'] should be `int` or `timedelta`, not `str`."
+        with self.assertRaisesMessage(TypeError, exc_message):
+            self.client.get(self.url)
+
+
+class TestAutoLogoutTimestampFormat(TestAutoLogout):
+    def _last_request(self):
+        return self.client.session.get('django_auto_logout_last_request')
+
+    def _set_last_request(self, value):
+        session = self.client.session
+        session['django_auto_logout_last_request'] = value
+        session.save()
+
+    def test_numeric_formats(self):
+        for timestamp_format, scale in (('seconds', 1), ('deciseconds', 10)):
+            settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'TIMESTAMP_FORMAT': timestamp_format}
+            self.client.force_login(self.user)
+            self.assertLoginRequiredIsOk()
+            self.assertIsInstance(self._last_request(), int)
+            self.assertAlmostEqual(self._last_request() / scale, self.clock.now().timestamp(), delta=1)
+
+            self.sleep(2)
+            self.assertLoginRequiredRedirect()
+
+    def test_legacy_iso_format_is_migrated(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 5,
+            'TIMESTAMP_FORMAT': 'deciseconds',
+        }
+        self.client.force_login(self.user)
+        self._set_last_request(timezone.now().isoformat())
+
+        self.assertLoginRequiredIsOk()
+        self.assertIsInstance(self._last_request(), int)
+
+        # and back
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': 5}
+        self.assertLoginRequiredIsOk()
+        self.assertIsInstance(self._last_request(), str)
+
+    def test_legacy_iso_format_is_read(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'TIMESTAMP_FORMAT': 'seconds'}
+        self.client.force_login(self.user)
+        self._set_last_request((timezone.now() - timedelta(seconds=2)).isoformat())
+        self.assertLoginRequiredRedirect()
+
+    def test_wrong_format(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'TIMESTAMP_FORMAT': 'ms'}
+
+        with self.assertRaisesMessage(ImproperlyConfigured, "TIMESTAMP_FORMAT should be"):
+            self.client.get(self.url)
+
+
+class TestAutoLogoutCacheActivityStore(TestAutoLogout):
+    def _cache_key(self):
+        return f'django_auto_logout:last_request:{self.client.session.session_key}'
+
+    def test_logout_idle_time(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 1,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.assertNotIn('django_auto_logout_last_request', self.client.session)
+        self.assertIsNotNone(cache.get(self._cache_key()))
+
+        for _ in range(3):
+            self.sleep(0.5)
+            self.assertLoginRequiredIsOk()
+
+        self.sleep(1.5)
+        self.assertLoginRequiredRedirect()
+
+    def test_requests_dont_save_session(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertLoginRequiredIsOk()
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+
+    def test_idle_time_resolution(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 5,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        self.client.force_login(self.user)
+        UserModel.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - timedelta(minutes=1))
+        cache.set(self._cache_key(), time() - 1)
+
+        self.assertLoginRequiredIsOk()
+        self.assertLess(cache.get(self._cache_key()), time() - 1)
+
+        cache.set(self._cache_key(), time() - 6)
+        self.assertLoginRequiredIsOk()
+        self.assertAlmostEqual(cache.get(self._cache_key()), time(), delta=1)
+
+    def test_idle_since_login_if_there_is_no_key(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 1,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        cache.delete(self._cache_key())
+        self.assertLoginRequiredIsOk()
+
+        cache.delete(self._cache_key())
+        self.sleep(1)
+        self.assertLoginRequiredRedirect()
+
+    def test_per_user(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 1,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+            'ACTIVITY_KEY': 'user',
+        }
+        cache.set(f'django_auto_logout:last_request:user:{self.user.pk}', time() - 60)
+
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.assertAlmostEqual(cache.get(f'django_auto_logout:last_request:user:{self.user.pk}'), time(), delta=1)
+
+        self.sleep(1.5)
+        self.assertLoginRequiredRedirect()
+        self.assertIsNone(cache.get(f'django_auto_logout:last_request:user:{self.user.pk}'))
+
+    def test_wrong_store(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'ACTIVITY_STORE': 'django.core.cache.cache'}
+
+        with self.assertRaisesMessage(ImproperlyConfigured, "ACTIVITY_STORE should be a subclass"):
+            self.client.get(self.url)
+
+
+class TestAutoLogoutBufferedCacheActivityStore(TestAutoLogout):
+    def setUp(self):
+        super().setUp()
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.BufferedCacheActivityStore',
+            'ACTIVITY_FLUSH_INTERVAL': 0.5,
+        }
+
+    def _cache_key(self):
+        return f'django_auto_logout:last_request:{self.client.session.session_key}'
+
+    def test_flush_in_background(self):
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.assertIsNone(cache.get(self._cache_key()))
+
+        sleep(1)  # the flush thread works in real time
+        self.assertAlmostEqual(cache.get(self._cache_key()), time(), delta=2)
+
+    def test_flush_full_buffer(self):
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'ACTIVITY_BUFFER_SIZE': 1}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.assertAlmostEqual(cache.get(self._cache_key()), time(), delta=1)
+
+    def test_flush_latest_time(self):
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        store = get_config().activity_store
+        first_time = store.get_value(self._cache_key())
+
+        self.assertLoginRequiredIsOk()
+        store.flush()
+        self.assertGreater(cache.get(self._cache_key()), first_time)
+
+    def test_logout_idle_time(self):
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'IDLE_TIME': 5}
+        self.client.force_login(self.user)
+        UserModel.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - timedelta(minutes=1))
+        store = get_config().activity_store
+        key = self._cache_key()
+
+        store.set_value(key, time() - 4)
+        self.assertLoginRequiredIsOk()
+
+        store.set_value(key, time() - 6)
+        self.assertLoginRequiredRedirect()
+        self.assertIsNone(store.get_value(key))
+
+    @requires_async_auth
+    @requires_async_session
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async(self):
+        # The buffer is read, written and flushed with the async cache API in the event loop.
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'IDLE_TIME': 5}
+        store = get_config().activity_store
+        sync_call = mock.Mock(side_effect=AssertionError('sync cache call'))
+        await self.async_client.aforce_login(self.user)
+        await UserModel.objects.filter(pk=self.user.pk).aupdate(last_login=timezone.now() - timedelta(minutes=1))
+        key = f'django_auto_logout:last_request:{(await self.async_client.asession()).session_key}'
+
+        with mock.patch.object(BufferedCacheActivityStore, 'set_value', sync_call), \
+                mock.patch.object(BufferedCacheActivityStore, 'delete_value', sync_call), \
+                mock.patch.object(BufferedCacheActivityStore, 'flush', sync_call):
+            await store.aset_value(key, self.clock.now().timestamp() - 4)
+            self.assertContains(await self.async_client.get(self.url), 'login required view')
+            self.assertAlmostEqual(store._buffer[key], self.clock.now().timestamp(), delta=1)
+            self.assertIsNone(await cache.aget(key))
+
+            await store.aflush()
+            self.assertAlmostEqual(await cache.aget(key), self.clock.now().timestamp(), delta=1)
+
+            # `aload` reads the buffered time before the cached one.
+            store._buffer[key] = self.clock.now().timestamp() - 6
+            self.assertEqual((await self.async_client.get(self.url)).status_code, 302)
+            self.assertNotIn(key, store._buffer)
+            self.assertIsNone(await cache.aget(key))
+
+        sync_call.assert_not_called()
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async_flush_full_buffer(self):
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'ACTIVITY_BUFFER_SIZE': 1}
+        await self.async_client.aforce_login(self.user)
+        key = f'django_auto_logout:last_request:{(await self.async_client.asession()).session_key}'
+
+        self.assertContains(await self.async_client.get(self.url), 'login required view')
+        self.assertEqual(get_config().activity_store._buffer, {})
+        self.assertAlmostEqual(await cache.aget(key), self.clock.now().timestamp(), delta=1)
+
+    def test_flush_interval_is_too_long(self):
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'ACTIVITY_FLUSH_INTERVAL': 2}
+
+        with self.assertRaisesMessage(ImproperlyConfigured, "ACTIVITY_FLUSH_INTERVAL should be at most"):
+            self.client.get(self.url)
+
+
+class TestAutoLogoutSignedCookieActivityStore(TestAutoLogout):
+    cookie_name = 'auto_logout_activity'
+
+    def setUp(self):
+        super().setUp()
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 2,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.SignedCookieActivityStore',
+        }
+
+    def test_logout_idle_time(self):
+        self.client.force_login(self.user)
+        session_data = dict(self.client.session)
+
+        resp = self.assertLoginRequiredIsOk()
+        self.assertNotIn(self.cookie_name, resp.cookies)  # the login is within IDLE_TIME_RESOLUTION
+
+        for _ in range(3):
+            self.sleep(8)
+            resp = self.assertLoginRequiredIsOk()
+            self.assertIn(self.cookie_name, resp.cookies)
+
+        self.assertEqual(dict(self.client.session), session_data)  # the session isn't changed
+
+        self.sleep(11)
+        resp = self.assertLoginRequiredRedirect()
+        self.assertEqual(resp.cookies[self.cookie_name].value, '')  # deleted
+
+    def test_invalid_cookie(self):
+        self.client.force_login(self.user)
+        self.sleep(8)
+        self.assertLoginRequiredIsOk()
+        self.sleep(8)
+        self.assertLoginRequiredIsOk()
+
+        # Without a valid cookie the user is idle since the login.
+        value = self.client.cookies[self.cookie_name].value
+        self.client.cookies[self.cookie_name] = value.replace(':', ':9', 1)
+        self.assertLoginRequiredRedirect()
+
+    def test_cookie_of_another_user(self):
+        other_client = self.client_class()
+        other_client.force_login(self.superuser)
+        self.client.force_login(self.user)
+        self.sleep(8)
+        self.assertContains(other_client.get(self.url), 'login required view')
+
+        self.sleep(8)
+        self.client.cookies[self.cookie_name] = other_client.cookies[self.cookie_name].value
+        self.assertLoginRequiredRedirect()
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_without_queries(self):
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'SESSION_TIME': 60, 'STORE_LOGIN_TIME': True}
+        resp = self.client.post(settings.LOGIN_URL, {'username': 'user', 'password': 'pass'})
+        self.assertIn(self.cookie_name, resp.cookies)  # with the login time
+        self.assertLoginRequiredIsOk()
+
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/healthz/'), 'ok')
+
+        self.sleep(61)
+        self.assertLoginRequiredRedirect()
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async(self):
+        await self.async_client.aforce_login(self.user)
+        for _ in range(2):
+            self.sleep(8)
+            resp = await self.async_client.get(self.url)
+            self.assertContains(resp, 'login required view')
+            self.assertIn(self.cookie_name, resp.cookies)
+
+        # The cookie is valid, but the last request is older than `IDLE_TIME`.
+        self.sleep(11)
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.cookies[self.cookie_name].value, '')  # deleted
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async_invalid_cookie(self):
+        await self.async_client.aforce_login(self.user)
+        self.sleep(8)
+        self.assertContains(await self.async_client.get(self.url), 'login required view')
+        self.sleep(8)
+
+        # Without a valid cookie the user is idle since the login.
+        value = self.async_client.cookies[self.cookie_name].value
+        self.async_client.cookies[self.cookie_name] = value.replace(':', ':9', 1)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 302)
+
+    def test_sweep_is_not_supported(self):
+        with self.assertRaisesMessage(CommandError, "ACTIVITY_STORE keeps the activity on the client"):
+            call_command('autologout_sweep', stdout=StringIO())
+
+
+class TestAutoLogoutExclude(TestAutoLogout):
+    def _test_excluded(self):
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/healthz/'), 'ok')
+
+        self.sleep(1)
+        self.assertContains(self.client.get('/healthz/'), 'ok')
+        self.assertLoginRequiredRedirect()
+
+    def test_exclude_paths(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'EXCLUDE_PATHS': ['/static/', '/healthz']}
+        self._test_excluded()
+
+    def test_exclude_url_names(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'EXCLUDE_URL_NAMES': ['healthz', 'admin:index']}
+        self._test_excluded()
+
+        with self.assertNumQueries(0):
+            self.client.get('/admin/')
+
+    def test_not_excluded(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'EXCLUDE_PATHS': ['/static/'], 'EXCLUDE_URL_NAMES': ['admin:index']}
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/healthz/')
+        self.assertGreater(len(queries), 0)
+
+        self.assertEqual(self.client.get('/not-found/').status_code, 404)
+
+        self.sleep(1)
+        self.assertLoginRequiredRedirect()
+
+
+def custom_logout(request, options):
+    logout(request)
+    return HttpResponse(options['CUSTOM_LOGOUT_MESSAGE'])
+
+
+async def acustom_logout(request, options):
+    await sync_to_async(logout)(request)
+    return HttpResponse(options['CUSTOM_LOGOUT_MESSAGE'])
+
+
+class TestAutoLogoutConfig(TestAutoLogout):
+    def test_config_is_cached(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'SESSION_TIME': timedelta(minutes=1)}
+        config = get_config()
+        self.assertIs(get_config(), config)
+        self.assertEqual(config.idle_time, timedelta(seconds=1))
+        self.assertEqual(config.session_time, timedelta(minutes=1))
+        self.assertIsNone(config.idle_time_resolution)
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 2}
+        self.assertEqual(get_config().idle_time, timedelta(seconds=2))
+        self.assertIsNone(get_config().session_time)
+
+        settings.AUTO_LOGOUT = {}
+        self.assertIsNone(get_config())
+
+    def test_config_is_immutable(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        config = get_config()
+
+        with self.assertRaises(AttributeError):
+            config.idle_time = timedelta(seconds=2)
+
+        with self.assertRaises(AttributeError):
+            del config.idle_time
+
+    def test_config_is_reset_on_setting_changed(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        config = get_config()
+
+        with override_settings(AUTO_LOGOUT={'IDLE_TIME': 2}):
+            self.assertEqual(get_config().idle_time, timedelta(seconds=2))
+
+        self.assertIsNot(get_config(), config)
+        self.assertEqual(get_config().idle_time, timedelta(seconds=1))
+
+    def test_custom_logout_func(self):
+        settings.AUTO_LOGOUT = {
+            'SESSION_TIME': 1,
+            'CUSTOM_LOGOUT_FUNC': f'{__name__}.custom_logout',
+            'CUSTOM_LOGOUT_MESSAGE': 'custom logout',
+        }
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(1)
+        self.assertContains(self.client.get(self.url), 'custom logout')
+        self.assertLoginRequiredRedirect()
+
+    def test_async_custom_logout_func(self):
+        # The sync middleware runs an async `CUSTOM_LOGOUT_FUNC` too.
+        settings.AUTO_LOGOUT = {
+            'SESSION_TIME': 1,
+            'CUSTOM_LOGOUT_FUNC': f'{__name__}.acustom_logout',
+            'CUSTOM_LOGOUT_MESSAGE': 'async custom logout',
+        }
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(1)
+        self.assertContains(self.client.get(self.url), 'async custom logout')
+        self.assertLoginRequiredRedirect()
+
+    def test_custom_logout_func_is_not_callable(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 1, 'CUSTOM_LOGOUT_FUNC': 1}
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'CUSTOM_LOGOUT_FUNC should be a function'):
+            self.client.get(self.url)
+
+
 class TestAutoLogoutCombineConfigs(TestAutoLogout):
     def test_combine_idle_and_session_time(self):
         settings.AUTO_LOGOUT = {
@@ -144,13 +764,13 @@ class TestAutoLogoutCombineConfigs(TestAutoLogout):
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
 
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredRedirect()
 
     def test_combine_idle_and_session_time_but_session_less_than_idle(self):
@@ -161,21 +781,21 @@ class TestAutoLogoutCombineConfigs(TestAutoLogout):
 
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredRedirect()
 
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredIsOk()
-        sleep(0.5)
+        self.sleep(0.5)
         self.assertLoginRequiredRedirect()
 
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
-        sleep(1)
+        self.sleep(1)
         self.assertLoginRequiredRedirect()
 
 
@@ -187,7 +807,7 @@ class TestAutoLogoutMessage(TestAutoLogout):
         }
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
-        sleep(1)
+        self.sleep(1)
         resp = self.assertLoginRequiredRedirect()
 
         # display message after redirect
@@ -209,7 +829,7 @@ class TestAutoLogoutMessage(TestAutoLogout):
         }
         self.client.force_login(self.user)
         self.assertLoginRequiredIsOk()
-        sleep(1)
+        self.sleep(1)
         resp = self.assertLoginRequiredRedirect()
         resp = self.client.get(resp['location'])
         self.assertContains(resp, 'login page', msg_prefix=resp.content.decode())
@@ -270,3 +890,1177 @@ class TestAutoLogoutRedirectToLoginPage(TestAutoLogout):
 
         settings.AUTO_LOGOUT = {}
         self.assertNotContains(self.client.get(self.url), '<script>')
+
+    def test_context_values(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'SESSION_TIME': 120, 'REDIRECT_TO_LOGIN_IMMEDIATELY': True}
+        self.client.force_login(self.user)
+        request = RequestFactory().get(self.url)
+        request.session = self.client.session
+        request.user = AnonymousUser()
+        self.assertEqual(auto_logout_client(request), {})
+
+        # The values are computed once per request, with the time of the middleware.
+        request = RequestFactory().get(self.url)
+        request.session = self.client.session
+        request.user = self.user
+        request._django_auto_logout_now = timezone.now()
+        ctx = auto_logout_client(request)
+        self.assertEqual(
+            set(ctx), {'seconds_until_session_end', 'seconds_until_idle_end', 'redirect_to_login_immediately'},
+        )
+        self.assertEqual(ctx['seconds_until_idle_end'], 10)
+        request._django_auto_logout_now += timedelta(seconds=5)
+        self.assertEqual(auto_logout_client(request)['seconds_until_idle_end'], 10)
+
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.context['seconds_until_idle_end'], 10)
+        self.assertContains(resp, '<script>')
+
+    def test_context_values_json(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'SESSION_TIME': 120}
+        self.client.force_login(self.user)
+        request = RequestFactory().get(self.url)
+        request.session = self.client.session
+        request.user = self.user
+
+        template = Template('{{ seconds_until_idle_end|json_script:"idle" }}')
+        self.assertHTMLEqual(
+            template.render(RequestContext(request)), '<script id="idle" type="application/json">10.0</script>',
+        )
+        data = json.loads(json.dumps(auto_logout_client(request)))
+        self.assertEqual(data['seconds_until_idle_end'], 10)
+        self.assertAlmostEqual(data['seconds_until_session_end'], 120, delta=2)
+
+    def test_inline_script_is_trimmed(self):
+        self.client.force_login(self.user)
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'REDIRECT_TO_LOGIN_IMMEDIATELY': True}
+        script = self.client.get(self.url).context['redirect_to_login_immediately']
+        at = script[script.index('at='):script.index('+999;') + len('+999;')]
+        self.assertEqual(script, _trim(LOGOUT_TIMEOUT_SCRIPT_PATTERN % at))
+
+    def test_static_script(self):
+        self.client.force_login(self.user)
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'SESSION_TIME': 120,
+            'REDIRECT_TO_LOGIN_IMMEDIATELY': True,
+            'CLIENT_SCRIPT': 'static',
+        }
+        resp = self.client.get(self.url)
+        self.assertContains(resp, f'<script src="/static/django_auto_logout/auto_logout.js?v={__version__}"')
+        self.assertNotContains(resp, 'Math.min')
+
+        script = resp.context['redirect_to_login_immediately']
+        seconds = float(script.split('data-seconds="')[1].split('"')[0])
+        self.assertAlmostEqual(seconds, 10, delta=1)
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'CLIENT_SCRIPT': 'js'}
+        with self.assertRaisesMessage(ImproperlyConfigured, "CLIENT_SCRIPT should be 'inline' or 'static'"):
+            self.client.get(self.url)
+
+    def test_leader_script(self):
+        self.client.force_login(self.user)
+        options = {
+            'IDLE_TIME': 10,
+            'REDIRECT_TO_LOGIN_IMMEDIATELY': True,
+            'CLIENT_SCRIPT': 'static',
+            'CLIENT_COORDINATION': 'leader',
+        }
+        settings.AUTO_LOGOUT = options
+        script = self.client.get(self.url).context['redirect_to_login_immediately']
+        self.assertIn('" data-leader data-check-url="/auto-logout/remaining/" defer></script>', script)
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_CHECK_URL': '', 'CLIENT_REDIRECT_URL': '/login/?next=/'}
+        script = self.client.get(self.url).context['redirect_to_login_immediately']
+        self.assertIn('" data-leader data-redirect-url="/login/?next=/" defer></script>', script)
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_SCRIPT': 'inline'}
+        exc_message = "CLIENT_COORDINATION 'leader' needs CLIENT_SCRIPT 'static'"
+        with self.assertRaisesMessage(ImproperlyConfigured, exc_message):
+            self.client.get(self.url)
+
+    def test_client_jitter(self):
+        self.client.force_login(self.user)
+        options = {'IDLE_TIME': 10, 'REDIRECT_TO_LOGIN_IMMEDIATELY': True, 'CLIENT_JITTER': timedelta(seconds=30)}
+        settings.AUTO_LOGOUT = options
+        self.assertContains(self.client.get(self.url), '*1000+999+Math.random()*30000;')
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_SCRIPT': 'static'}
+        script = self.client.get(self.url).context['redirect_to_login_immediately']
+        self.assertIn('" data-jitter="30000" defer></script>', script)
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_JITTER': 0.5}
+        exc_message = "AUTO_LOGOUT['CLIENT_JITTER'] should be `int` or `timedelta`, not `float`."
+        with self.assertRaisesMessage(TypeError, exc_message):
+            self.client.get(self.url)
+
+    def test_logout_retry_after(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.sleep(1)
+        resp = self.client.get(self.url)
+        self.assertRedirects(resp, f'{settings.LOGIN_URL}?next={self.url}', fetch_redirect_response=False)
+        self.assertFalse(resp.has_header('Retry-After'))
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'LOGOUT_RETRY_AFTER': 30}
+        self.client.force_login(self.user)
+        resp = self.client.get(self.url)
+        self.assertFalse(resp.has_header('Retry-After'))
+        self.sleep(1)
+        resp = self.client.get(self.url)
+        self.assertRedirects(resp, f'{settings.LOGIN_URL}?next={self.url}', fetch_redirect_response=False)
+        self.assertEqual(resp['Retry-After'], '30')
+
+
+class RecordingExporter(MetricsExporter):
+    def __init__(self):
+        self.calls = []
+
+    def increment(self, name, value=1):
+        self.calls.append(('increment', name, value))
+
+    def observe(self, name, value):
+        self.calls.append(('observe', name))
+
+
+class TestAutoLogoutMetrics(TestAutoLogout):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_metrics(self):
+        exporter = RecordingExporter()
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 5,
+            'METRICS_EXPORTERS': [exporter],
+        }
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.assertLoginRequiredIsOk()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'checks': 3, 'activity.writes': 1, 'activity.skipped': 2})
+        histogram = snapshot['histograms']['check.seconds']
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(histogram['buckets'][float('inf')], 3)
+        self.assertEqual(exporter.calls.count(('increment', 'checks', 1)), 3)
+        self.assertEqual(exporter.calls.count(('observe', 'check.seconds')), 3)
+
+    def test_logout_reasons(self):
+        for options, reason in (({'SESSION_TIME': 1}, 'session'), ({'IDLE_TIME': 1}, 'idle')):
+            settings.AUTO_LOGOUT = {**options, 'METRICS': True}
+            self.client.force_login(self.user)
+            self.assertLoginRequiredIsOk()
+            self.sleep(1.1)
+            self.assertLoginRequiredRedirect()
+            self.assertEqual(metrics.snapshot()['counters'][f'logouts.{reason}'], 1)
+
+    def test_no_metrics(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10}
+        self.assertIsNone(get_config().metrics)
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        self.assertEqual(metrics.snapshot(), {'counters': {}, 'histograms': {}})
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'METRICS_EXPORTERS': [object()]}
+        with self.assertRaisesMessage(ImproperlyConfigured, "METRICS_EXPORTERS should be subclasses or instances"):
+            get_config()
+
+
+class TestAutoLogoutDeadlineCache(TestAutoLogout):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_idle_time(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': 5, 'DEADLINE_CACHE_SIZE': 100, 'METRICS': True}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        last_request = self.client.session['django_auto_logout_last_request']
+        self.assertEqual(len(get_config().deadline_cache), 1)
+
+        # Requests before the next write skip the checks.
+        self.sleep(4)
+        self.assertLoginRequiredIsOk()
+        self.assertEqual(metrics.snapshot()['counters'], {'checks': 2, 'checks.cached': 1, 'activity.writes': 1})
+
+        self.sleep(2)
+        self.assertLoginRequiredIsOk()
+        self.assertNotEqual(self.client.session['django_auto_logout_last_request'], last_request)
+        self.assertEqual(metrics.snapshot()['counters']['activity.writes'], 2)
+
+        self.sleep(11)
+        self.assertLoginRequiredRedirect()
+        self.assertEqual(metrics.snapshot()['counters']['logouts.idle'], 1)
+
+    def test_session_time(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 10, 'DEADLINE_CACHE_SIZE': 100, 'METRICS': True}
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.assertLoginRequiredIsOk()
+            self.sleep(3)
+        self.assertEqual(metrics.snapshot()['counters'], {'checks': 3, 'checks.cached': 2})
+
+        self.sleep(1.1)
+        self.assertLoginRequiredRedirect()
+        self.assertEqual(metrics.snapshot()['counters']['logouts.session'], 1)
+
+    def test_wrong_settings(self):
+        # Without `IDLE_TIME_RESOLUTION` every request writes the time, nothing is skipped.
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'SESSION_TIME': 120, 'DEADLINE_CACHE_SIZE': 100}
+        message = "DEADLINE_CACHE_SIZE with IDLE_TIME needs IDLE_TIME_RESOLUTION"
+        with self.assertRaisesMessage(ImproperlyConfigured, message):
+            get_config()
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': 5, 'DEADLINE_CACHE_SIZE': '100'}
+        with self.assertRaisesMessage(ImproperlyConfigured, "DEADLINE_CACHE_SIZE should be a number of sessions"):
+            get_config()
+
+    def test_login_and_logout(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 60, 'DEADLINE_CACHE_SIZE': 100}
+        deadline_cache = get_config().deadline_cache
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        session_key = self.client.session.session_key
+        self.assertEqual(len(deadline_cache), 1)
+
+        self.client.logout()
+        self.assertEqual(len(deadline_cache), 0)
+
+        # A login (e.g. with a new login time, see `STORE_LOGIN_TIME`) drops the deadline of its session.
+        deadline_cache.set(session_key, time() + 60)
+        request = RequestFactory().get(self.url)
+        request.session = mock.Mock(session_key=session_key)
+        user_logged_in.send(sender=UserModel, request=request, user=self.user)
+        self.assertEqual(len(deadline_cache), 0)
+
+    def test_policies(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 600,
+            'IDLE_TIME_RESOLUTION': 300,
+            'DEADLINE_CACHE_SIZE': 100,
+            'POLICY_RESOLVER': 'django_auto_logout.policies.group_policy',
+            'GROUP_POLICIES': {'kiosk': {'IDLE_TIME': 3600}},
+            'POLICY_CACHE_TTL': 10,
+        }
+        deadline_cache = get_config().deadline_cache
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        # The deadline isn't later than the end of the cached policy.
+        deadline = deadline_cache._data[self.client.session.session_key]
+        self.assertAlmostEqual(deadline, self.clock.now().timestamp() + 10, delta=1)
+
+        self.user.groups.add(Group.objects.create(name='kiosk'))
+        self.assertEqual(len(deadline_cache), 0)
+
+    def test_bounded(self):
+        cache = DeadlineCache(maxsize=2)
+        cache.set('a', 100)
+        cache.set('b', 100)
+        self.assertTrue(cache.is_before('a', 99))
+        cache.set('c', 100)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(cache.is_before('b', 99))
+        self.assertFalse(cache.is_before('a', 100))
+        self.assertEqual(len(cache), 1)
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': 5, 'DEADLINE_CACHE_SIZE': 100, 'METRICS': True}
+        await self.async_client.aforce_login(self.user)
+        for _ in range(3):
+            resp = await self.async_client.get(self.url)
+            self.assertContains(resp, 'login required view')
+        self.assertEqual(metrics.snapshot()['counters']['checks.cached'], 2)
+
+        self.sleep(11)
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp.status_code, 302)
+
+
+class TestAutoLogoutPolicies(TestAutoLogout):
+    def setUp(self):
+        super().setUp()
+        self.kiosk = Group.objects.create(name='kiosk')
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 60,
+            'SESSION_TIME': 3600,
+            'REDIRECT_TO_LOGIN_IMMEDIATELY': True,
+            'POLICY_RESOLVER': 'django_auto_logout.policies.group_policy',
+            'GROUP_POLICIES': {
+                'is_superuser': {'IDLE_TIME': 1},
+                'kiosk': {'IDLE_TIME': 600, 'SESSION_TIME': 86400},
+            },
+        }
+
+    def _get_context(self):
+        resp = self.assertLoginRequiredIsOk()
+        return float(resp.context['seconds_until_idle_end']), float(resp.context['seconds_until_session_end'])
+
+    def test_group_policies(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self._get_context()[0], 60)
+
+        self.user.groups.add(self.kiosk)
+        idle, session = self._get_context()
+        self.assertEqual(idle, 600)
+        self.assertAlmostEqual(session, 86400, delta=5)
+
+        self.user.groups.remove(self.kiosk)
+        self.assertEqual(self._get_context()[0], 60)
+
+        self.client.force_login(self.superuser)
+        self.assertEqual(self._get_context()[0], 1)
+        self.sleep(1.5)
+        self.assertLoginRequiredRedirect()
+
+    def test_reverse_group_changes(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self._get_context()[0], 60)
+
+        self.kiosk.user_set.add(self.user)
+        self.assertEqual(self._get_context()[0], 600)
+
+        self.kiosk.user_set.remove(self.user)
+        self.assertEqual(self._get_context()[0], 60)
+
+        self.kiosk.user_set.add(self.user)
+        self.assertEqual(self._get_context()[0], 600)
+        self.kiosk.user_set.clear()
+        self.assertEqual(self._get_context()[0], 60)
+
+    def test_group_permission_changes(self):
+        def permission_policy(request, options):
+            return {'IDLE_TIME': 600} if request.user.has_perm('auth.view_group') else None
+
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'POLICY_RESOLVER': permission_policy}
+        permission = Permission.objects.get(codename='view_group')
+        self.user.groups.add(self.kiosk)
+        self.client.force_login(self.user)
+        self.assertEqual(self._get_context()[0], 60)
+
+        self.kiosk.permissions.add(permission)
+        self.assertEqual(self._get_context()[0], 600)
+
+        permission.group_set.remove(self.kiosk)
+        self.assertEqual(self._get_context()[0], 60)
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async_policy(self):
+        resolved_in_event_loop = []
+
+        def resolver(request, options):
+            try:
+                asyncio.get_running_loop()
+                resolved_in_event_loop.append(True)
+            except RuntimeError:
+                resolved_in_event_loop.append(False)
+            return group_policy(request, options)
+
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'POLICY_RESOLVER': resolver}
+        await self.kiosk.user_set.aadd(self.user)
+        await self.async_client.aforce_login(self.user)
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(float(resp.context['seconds_until_idle_end']), 600)
+        self.assertEqual(get_config().policy_cache.get(str(self.user.pk)), 'kiosk')
+
+        # The cached policy is used by the next requests.
+        await self.async_client.get(self.url)
+        self.assertEqual(resolved_in_event_loop, [False])
+
+        await self.async_client.aforce_login(self.superuser)
+        self.assertContains(await self.async_client.get(self.url), 'login required view')
+        self.sleep(1.5)
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp.status_code, 302)
+
+    def test_no_queries_on_hot_path(self):
+        self.user.groups.add(self.kiosk)
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        with CaptureQueriesContext(connection) as with_policy:
+            self.assertLoginRequiredIsOk()
+
+        options = dict(settings.AUTO_LOGOUT)
+        del options['POLICY_RESOLVER']
+        settings.AUTO_LOGOUT = options
+        self.assertLoginRequiredIsOk()
+
+        with CaptureQueriesContext(connection) as without_policy:
+            self.assertLoginRequiredIsOk()
+
+        self.assertEqual(len(with_policy), len(without_policy))
+
+    def test_policy_cache(self):
+        cache = PolicyCache(maxsize=2, ttl=0.1)
+        cache.set('1', {'IDLE_TIME': 1})
+        cache.set('2', None)
+        cache.set('3', {'IDLE_TIME': 3})
+        self.assertEqual(list(cache._data), ['2', '3'])  # the least recently used is evicted
+        self.assertEqual(cache.get('3'), {'IDLE_TIME': 3})
+
+        sleep(0.2)  # the TTL is in real time
+        cache.get('2')
+        cache.get('3')
+        self.assertEqual(len(cache), 0)  # expired
+
+    def test_list_policy_options(self):
+        settings.AUTO_LOGOUT['GROUP_POLICIES']['kiosk'] = {'IDLE_TIME': 600, 'PASSIVE_METHODS': ['HEAD']}
+        self.user.groups.add(self.kiosk)
+        self.client.force_login(self.user)
+        self.assertEqual(self._get_context()[0], 600)
+
+        config = get_config()
+        self.assertIs(config.with_policy('kiosk'), config.policies['kiosk'])
+        # Options of custom resolvers are built once too.
+        policy = {'IDLE_TIME': 600, 'PASSIVE_METHODS': ['HEAD']}
+        self.assertIs(config.with_policy(policy), config.with_policy(dict(policy)))
+        self.assertIsNot(config.with_policy(policy), config.policies['kiosk'])
+
+    def test_group_policies_wrong_type(self):
+        for policies in ([], {'kiosk': 600}):
+            with self.subTest(policies=policies):
+                settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'GROUP_POLICIES': policies}
+                with self.assertRaisesMessage(ImproperlyConfigured, "GROUP_POLICIES should be a dict of policies"):
+                    get_config()
+
+        # Options of a policy are checked on start.
+        settings.AUTO_LOGOUT = {**settings.AUTO_LOGOUT, 'GROUP_POLICIES': {'kiosk': {'PASSIVE_FUNC': 1}}}
+        with self.assertRaisesMessage(ImproperlyConfigured, "PASSIVE_FUNC should be a function"):
+            get_config()
+
+    def test_policy_resolver_wrong_type(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60, 'POLICY_RESOLVER': 1}
+        with self.assertRaisesMessage(ImproperlyConfigured, "POLICY_RESOLVER should be a function"):
+            get_config()
+
+
+class TestAutoLogoutPassive(TestAutoLogout):
+    def _last_request(self):
+        return self.client.session['django_auto_logout_last_request']
+
+    def test_passive_requests(self):
+        for options, path, kwargs in (
+            ({}, self.url, {'HTTP_X_AUTO_LOGOUT_PASSIVE': '1'}),
+            ({'PASSIVE_HEADERS': ['X-Background-Request']}, self.url, {'HTTP_X_BACKGROUND_REQUEST': 'true'}),
+            ({'PASSIVE_METHODS': ['head']}, self.url, {'method': 'head'}),
+            ({'PASSIVE_URL_NAMES': ['healthz']}, '/healthz/', {}),
+            ({'PASSIVE_FUNC': lambda request: 'poll' in request.GET}, self.url, {'data': {'poll': 1}}),
+        ):
+            with self.subTest(options=options):
+                settings.AUTO_LOGOUT = {'IDLE_TIME': 10, **options}
+                self.client = self.client_class()
+                self.client.force_login(self.user)
+                self.assertLoginRequiredIsOk()
+                last_request = self._last_request()
+
+                method = getattr(self.client, kwargs.pop('method', 'get'))
+                self.assertIn(method(path, **kwargs).status_code, (200, 302))
+                self.assertEqual(self._last_request(), last_request)
+
+                self.assertLoginRequiredIsOk()
+                self.assertNotEqual(self._last_request(), last_request)
+
+    def test_falsy_passive_headers(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'PASSIVE_HEADERS': ['X-Background-Request']}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        for kwargs in (
+            {'HTTP_X_AUTO_LOGOUT_PASSIVE': '0'},
+            {'HTTP_X_AUTO_LOGOUT_PASSIVE': 'false'},
+            {'HTTP_X_BACKGROUND_REQUEST': 'Off'},
+            {'HTTP_X_BACKGROUND_REQUEST': ''},
+        ):
+            with self.subTest(kwargs=kwargs):
+                last_request = self._last_request()
+                self.sleep(0.1)
+                self.assertEqual(self.client.get(self.url, **kwargs).status_code, 200)
+                self.assertNotEqual(self._last_request(), last_request)
+
+    def test_passive_request_is_checked(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'PASSIVE_URL_NAMES': ['healthz']}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(0.6)
+        self.client.get('/healthz/')
+        self.sleep(0.6)
+        self.client.get('/healthz/')
+        self.assertLoginRequiredRedirect()
+
+    def test_passive_func_wrong_type(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'PASSIVE_FUNC': 1}
+        with self.assertRaisesMessage(ImproperlyConfigured, "PASSIVE_FUNC should be a function"):
+            get_config()
+
+
+class TestAutoLogoutRemaining(TestAutoLogout):
+    def test_remaining(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'SESSION_TIME': 120}
+        self.assertEqual(self.client.get('/auto-logout/remaining/').json(), {'logged_in': False})
+
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+        last_request = self.client.session['django_auto_logout_last_request']
+
+        resp = self.client.get('/auto-logout/remaining/', HTTP_X_AUTO_LOGOUT_PASSIVE='1')
+        data = resp.json()
+        self.assertTrue(data['logged_in'])
+        self.assertLess(data['seconds_until_idle_end'], 10)
+        self.assertAlmostEqual(data['seconds_until_session_end'], 120, delta=2)
+        self.assertAlmostEqual(data['idle_end_at'], time() + 10, delta=2)
+        self.assertIn('no-cache', resp['Cache-Control'])
+        self.assertIn('private', resp['Cache-Control'])
+
+        # Polling isn't activity: the session isn't written and the deadlines are the same.
+        self.assertEqual(self.client.session['django_auto_logout_last_request'], last_request)
+        resp = self.client.get(
+            '/auto-logout/remaining/', HTTP_X_AUTO_LOGOUT_PASSIVE='1', HTTP_IF_NONE_MATCH=resp['ETag'],
+        )
+        self.assertEqual(resp.status_code, 304)
+
+        # Not passive requests are activity.
+        resp = self.client.get('/auto-logout/remaining/', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['seconds_until_idle_end'], 10)
+        self.assertNotEqual(self.client.session['django_auto_logout_last_request'], last_request)
+
+    def test_etag_changes_on_login(self):
+        settings.AUTO_LOGOUT = {'REDIRECT_TO_LOGIN_IMMEDIATELY': True}
+        resp = self.client.get('/auto-logout/remaining/')
+        self.assertEqual(resp.json(), {'logged_in': False})
+
+        # A user without limits has no deadlines either.
+        self.client.force_login(self.user)
+        resp = self.client.get('/auto-logout/remaining/', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {'logged_in': True})
+        resp = self.client.get('/auto-logout/remaining/', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_passive_request_logs_out(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(0.5)
+        self.client.get('/auto-logout/remaining/', HTTP_X_AUTO_LOGOUT_PASSIVE='1')
+        self.sleep(0.6)
+        self.assertEqual(
+            self.client.get('/auto-logout/remaining/', HTTP_X_AUTO_LOGOUT_PASSIVE='1').json(),
+            {'logged_in': False},
+        )
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_async_remaining(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'STORE_LOGIN_TIME': True, 'SESSION_TIME': 120}
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(self.url)
+
+        resp = await self.async_client.get('/auto-logout-async/remaining/', headers={'X-Auto-Logout-Passive': '1'})
+        self.assertAlmostEqual(resp.json()['seconds_until_session_end'], 120, delta=2)
+        resp = await self.async_client.get(
+            '/auto-logout-async/remaining/', headers={'X-Auto-Logout-Passive': '1', 'If-None-Match': resp['ETag']},
+        )
+        self.assertEqual(resp.status_code, 304)
+
+
+class TestAutoLogoutHeartbeat(TestAutoLogout):
+    def test_heartbeat(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'IDLE_TIME_RESOLUTION': 5}
+        self.assertEqual(self.client.post('/auto-logout/heartbeat/').status_code, 403)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/auto-logout/heartbeat/').status_code, 405)
+        self.assertLoginRequiredIsOk()
+        last_request = self.client.session['django_auto_logout_last_request']
+
+        # Within `IDLE_TIME_RESOLUTION` the heartbeat doesn't write the session.
+        self.sleep(2)
+        resp = self.client.post('/auto-logout/heartbeat/')
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(resp.content, b'')
+        self.assertAlmostEqual(float(resp['X-Auto-Logout-Deadline']), self.clock.now().timestamp() + 8, delta=1)
+        self.assertEqual(self.client.session['django_auto_logout_last_request'], last_request)
+
+        # Reading a page for longer than the idle time with heartbeats.
+        for _ in range(3):
+            self.sleep(6)
+            resp = self.client.post('/auto-logout/heartbeat/')
+            self.assertAlmostEqual(float(resp['X-Auto-Logout-Deadline']), self.clock.now().timestamp() + 10, delta=1)
+        self.assertNotEqual(self.client.session['django_auto_logout_last_request'], last_request)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(11)
+        self.assertEqual(self.client.post('/auto-logout/heartbeat/').status_code, 403)
+        self.assertLoginRequiredRedirect()
+
+    def test_heartbeat_script(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        options = {
+            'IDLE_TIME': 600,
+            'REDIRECT_TO_LOGIN_IMMEDIATELY': True,
+            'CLIENT_SCRIPT': 'static',
+            'CLIENT_HEARTBEAT': 60,
+        }
+        settings.AUTO_LOGOUT = options
+        script = client.get(self.url).context['redirect_to_login_immediately']
+        self.assertIn('" data-heartbeat="60000" data-heartbeat-url="/auto-logout/heartbeat/" defer></script>', script)
+
+        # The script sends the CSRF token of the page.
+        token = script.split('data-csrf-token="')[1].split('"')[0]
+        self.assertEqual(client.post('/auto-logout/heartbeat/').status_code, 403)
+        self.assertEqual(client.post('/auto-logout/heartbeat/', HTTP_X_CSRFTOKEN=token).status_code, 204)
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_HEARTBEAT_URL': '/heartbeat/'}
+        script = client.get(self.url).context['redirect_to_login_immediately']
+        self.assertIn(' data-heartbeat-url="/heartbeat/" ', script)
+
+        settings.AUTO_LOGOUT = {**options, 'CLIENT_SCRIPT': 'inline'}
+        with self.assertRaisesMessage(ImproperlyConfigured, "CLIENT_HEARTBEAT needs CLIENT_SCRIPT 'static'"):
+            client.get(self.url)
+
+
+class TestAutoLogoutSweep(TestAutoLogout):
+    def _login(self, user, idle_seconds: int):
+        client = self.client_class()
+        client.force_login(user)
+        session = client.session
+        session['django_auto_logout_last_request'] = encode_timestamp(
+            timezone.now() - timedelta(seconds=idle_seconds),
+        )
+        session.save()
+        return session.session_key
+
+    def test_sweep(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60}
+        idle_key = self._login(self.user, 120)
+        active_key = self._login(self.superuser, 10)
+        anonymous = self.client_class()
+        anonymous.get('/healthz/')
+        anonymous.session.save()
+
+        out = StringIO()
+        call_command('autologout_sweep', dry_run=True, stdout=out)
+        self.assertIn('Found 1 expired of 3 sessions', out.getvalue())
+        self.assertTrue(Session.objects.filter(session_key=idle_key).exists())
+
+        out = StringIO()
+        call_command('autologout_sweep', chunk_size=1, stdout=out)
+        self.assertIn('Deleted 1 expired of 3 sessions', out.getvalue())
+        self.assertFalse(Session.objects.filter(session_key=idle_key).exists())
+        self.assertTrue(Session.objects.filter(session_key=active_key).exists())
+
+    def test_sweep_with_policies(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 60,
+            'POLICY_RESOLVER': 'django_auto_logout.policies.group_policy',
+            'GROUP_POLICIES': {'is_staff': {'IDLE_TIME': 30}, 'kiosk': {'IDLE_TIME': 600}},
+        }
+        kiosk = Group.objects.create(name='kiosk')
+        for i in range(20):
+            user = UserModel.objects.create_user(f'user{i}', is_staff=i % 4 == 1)
+            if i % 2 == 0:
+                user.groups.add(kiosk)
+            self._login(user, 45)
+
+        # The sessions, the users with their fields and groups, the last (empty) chunk.
+        out = StringIO()
+        with self.assertNumQueries(4):
+            call_command('autologout_sweep', dry_run=True, stdout=out)
+        self.assertIn('Found 5 expired of 20 sessions', out.getvalue())
+
+    def test_sweep_buffered_activity(self):
+        # Other processes may have the activity of the last `ACTIVITY_FLUSH_INTERVAL` seconds in their buffers.
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.BufferedCacheActivityStore',
+            'ACTIVITY_FLUSH_INTERVAL': 1,
+        }
+        keys = {idle: self._login(self.user, 0) for idle in (10.5, 11.5)}
+        UserModel.objects.update(last_login=timezone.now() - timedelta(minutes=1))
+        for idle, session_key in keys.items():
+            cache.set(f'django_auto_logout:last_request:{session_key}', time() - idle)
+
+        call_command('autologout_sweep', stdout=StringIO())
+        self.assertTrue(Session.objects.filter(session_key=keys[10.5]).exists())
+        self.assertFalse(Session.objects.filter(session_key=keys[11.5]).exists())
+
+    def test_sweep_session_time(self):
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 60}
+        session_key = self._login(self.user, 0)
+        UserModel.objects.filter(pk=self.user.pk).update(last_login=timezone.now() - timedelta(minutes=2))
+
+        call_command('autologout_sweep', stdout=StringIO())
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+    def test_sweep_wrong_settings(self):
+        settings.AUTO_LOGOUT = {}
+        with self.assertRaisesMessage(CommandError, 'AUTO_LOGOUT has neither SESSION_TIME nor IDLE_TIME.'):
+            call_command('autologout_sweep', stdout=StringIO())
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60}
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cache'):
+            with self.assertRaisesMessage(CommandError, "doesn't store sessions in the database"):
+                call_command('autologout_sweep', stdout=StringIO())
+
+    def test_bulk_logout_deadlines(self):
+        current_time = timezone.now()
+        current = current_time.timestamp()
+        login_times = [current - 100, current - 10, None, current - 10]
+        last_requests = [current - 1, current - 50, current - 1, None]
+
+        for numpy in (utils.numpy, None):
+            with mock.patch.object(utils, 'numpy', numpy):
+                deadlines, expiring = utils.bulk_logout_deadlines(
+                    login_times, last_requests, current_time, session_time=60, idle_time=timedelta(seconds=30),
+                )
+                self.assertEqual(list(deadlines), [current - 40, current - 20, current + 29, current + 30])
+                self.assertEqual(list(expiring), [True, True, False, False])
+
+                _, expiring = utils.bulk_logout_deadlines(login_times, last_requests, current_time, within=10)
+                self.assertEqual(list(expiring), [False] * 4)  # no limits
+
+                _, expiring = utils.bulk_logout_deadlines(
+                    login_times, last_requests, current_time, idle_time=30, within=29.5,
+                )
+                self.assertEqual(list(expiring), [True, True, True, False])
+
+    def test_sessions_report(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600}
+        self._login(self.user, 10)
+        self._login(self.user, 400)
+        self._login(self.user, 700)  # expired, but not deleted yet
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/auto-logout/sessions/').status_code, 403)
+
+        self.client.force_login(self.superuser)
+        resp = self.client.get('/auto-logout/sessions/')
+        self.assertEqual(resp.json(), {'sessions': 4, 'expiring': 2, 'within': 300})
+        self.assertEqual(self.client.get('/auto-logout/sessions/', {'within': 0}).json()['expiring'], 1)
+        self.assertEqual(self.client.get('/auto-logout/sessions/', {'within': 'x'}).status_code, 400)
+
+
+class TestAutoLogoutPush(TestAutoLogout):
+    async def test_registry_many_idle_clients(self):
+        registry = Registry(max_sessions=10000)
+        clients = 5000
+        after = [registry.open(f'session-{i}') for i in range(clients)]
+        waiters = [
+            asyncio.ensure_future(registry.wait(f'session-{i}', after[i], timeout=10))
+            for i in range(clients)
+        ]
+        await asyncio.sleep(0.1)  # all the clients are waiting
+
+        # The middleware publishes from the worker threads.
+        started = time()
+        thread = threading.Thread(target=lambda: [
+            registry.publish(f'session-{i}', 'deadline', {'deadline': i}) for i in range(clients)
+        ])
+        thread.start()
+        events = await asyncio.gather(*waiters)
+        thread.join()
+        self.assertLess(time() - started, 5)
+
+        self.assertEqual([event.data['deadline'] for event in events], list(range(clients)))
+        self.assertEqual(len({event.id for event in events}), clients)
+        self.assertFalse(any(channel.waiters for channel in registry._channels.values()))
+
+        # Idle clients time out and leave nothing behind, the last event is kept for the next wait.
+        self.assertIsNone(await registry.wait('session-0', events[0].id, timeout=0.01))
+        self.assertEqual(await registry.wait('session-0', after[0], timeout=0.01), events[0])
+        self.assertFalse(registry._channels['session-0'].waiters)
+
+        # Unknown sessions are ignored, old ones are forgotten.
+        registry.publish('unknown', 'logout')
+        self.assertNotIn('unknown', registry._channels)
+        registry.max_sessions = 10
+        registry.open('session-new')
+        self.assertEqual(len(registry), 10)
+
+    @requires_async_auth
+    @requires_anext
+    async def test_events(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60, 'PUSH_EVENTS': True, 'EXCLUDE_PATHS': ['/auto-logout/']}
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(self.url)
+
+        resp = await self.async_client.get('/auto-logout/events/')
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        stream = aiter(resp.streaming_content)
+        first = (await anext(stream)).decode()
+        self.assertIn('event: deadline', first)
+        deadline = json.loads(first.split('data: ')[1])['deadline']
+        self.assertAlmostEqual(deadline, time() + 60, delta=2)
+
+        await asyncio.sleep(0.1)
+        await self.async_client.get(self.url)
+        second = (await anext(stream)).decode()
+        self.assertIn('event: deadline', second)
+        self.assertGreater(json.loads(second.split('data: ')[1])['deadline'], deadline)
+
+        await self.async_client.alogout()
+        self.assertIn('event: logout', (await anext(stream)).decode())
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)  # the sync middleware would wait for the poll
+    async def test_poll(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'PUSH_EVENTS': True, 'EXCLUDE_PATHS': ['/auto-logout/']}
+        resp = await self.async_client.get('/auto-logout/poll/')
+        self.assertEqual(resp.json()['event'], 'logout')
+
+        await self.async_client.aforce_login(self.user)
+        state = (await self.async_client.get('/auto-logout/poll/')).json()
+        self.assertEqual(state['event'], 'deadline')
+
+        poll = asyncio.ensure_future(self.async_client.get('/auto-logout/poll/', {'after': state['id']}))
+        await asyncio.sleep(0.1)
+        await self.async_client.get(self.url)
+        event = (await poll).json()
+        self.assertEqual(event['event'], 'deadline')
+        self.assertGreater(event['id'], state['id'])
+
+        # Polling isn't activity.
+        self.sleep(1.5)
+        self.assertEqual((await self.async_client.get('/auto-logout/poll/')).json()['event'], 'logout')
+
+        resp = await self.async_client.get('/auto-logout/poll/', {'after': 'x'})
+        self.assertEqual(resp.status_code, 400)
+
+    @requires_async_auth
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_poll_logout(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'PUSH_EVENTS': True, 'EXCLUDE_PATHS': ['/auto-logout/']}
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(self.url)
+        session_key = (await self.async_client.asession()).session_key
+        state = (await self.async_client.get('/auto-logout/poll/')).json()
+        self.assertIn(session_key, registry)
+
+        # The session ends while the client waits for the next poll: it gets `logout` at once.
+        self.sleep(1.5)
+        started = time()
+        resp = await self.async_client.get('/auto-logout/poll/', {'after': state['id']})
+        self.assertLess(time() - started, 1)
+        self.assertEqual(resp.json(), {'id': state['id'], 'event': 'logout'})
+        self.assertNotIn(session_key, registry)
+
+    @override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+    async def test_anonymous_sessions_are_not_kept(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60, 'PUSH_EVENTS': True, 'EXCLUDE_PATHS': ['/auto-logout/']}
+        channels = len(registry)
+        with mock.patch.object(registry, 'open', wraps=registry.open) as open_channel:
+            for i in range(20):
+                self.async_client.cookies[settings.SESSION_COOKIE_NAME] = f'made-up-session-{i}'
+                resp = await self.async_client.get('/auto-logout/poll/', {'after': 1})
+                self.assertEqual(resp.json()['event'], 'logout')
+                resp = await self.async_client.get('/auto-logout/poll/')
+                self.assertEqual(resp.json()['event'], 'logout')
+
+        # Made-up sessions don't take (and evict) places of the real listeners even for a moment.
+        open_channel.assert_not_called()
+        self.assertEqual(len(registry), channels)
+
+        self.assertIsNone(await registry.wait('made-up-session-0', 0, timeout=10))
+        self.assertNotIn('made-up-session-0', registry)
+
+
+class TestAutoLogoutClock(TestAutoLogout):
+    def test_clock_setting(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        self.assertIs(get_config().clock, system_clock)
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'CLOCK': 'django_auto_logout.clock.VirtualClock'}
+        self.assertIsInstance(get_config().clock, VirtualClock)
+        self.assertIs(get_clock(), self.clock)  # `override_clock` is first
+
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'CLOCK': timezone.now}
+        with self.assertRaisesMessage(ImproperlyConfigured, "CLOCK should be a subclass or an instance"):
+            get_config()
+
+    def test_virtual_clock(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 60, 'SESSION_TIME': 3600}
+        self.client.force_login(self.user)
+
+        with override_clock(VirtualClock(self.clock.now())) as clock:
+            for _ in range(10):
+                clock.advance(timedelta(seconds=59))
+                self.assertLoginRequiredIsOk()
+
+            clock.advance(61)
+            self.assertLoginRequiredRedirect()
+
+    def test_replay(self):
+        timelines = [
+            [],
+            [30, 60, 90],
+            [30, 100],  # idle for 70 seconds
+            [50 * i for i in range(1, 10)],  # the session ends at 300
+        ]
+        options = {'IDLE_TIME': 60, 'SESSION_TIME': 300}
+        self.assertEqual(replay(timelines, options), [None, None, 100, 350])
+
+        # The time of the last request is stored once a minute: 50 isn't stored.
+        options = {'IDLE_TIME': 60, 'IDLE_TIME_RESOLUTION': 60, 'TIMESTAMP_FORMAT': 'seconds'}
+        self.assertEqual(replay([[10, 50, 80]], options), [80])
+
+        settings.AUTO_LOGOUT = {'SESSION_TIME': 60, 'STORE_LOGIN_TIME': True}
+        self.assertEqual(replay([[59.9, 60.1]]), [60.1])
+
+        # Cache stores use a private cache: replays don't depend on each other or touch `ACTIVITY_CACHE`.
+        start = timezone.now()
+        for activity_key in ('session', 'user'):
+            options = {
+                'IDLE_TIME': 60,
+                'IDLE_TIME_RESOLUTION': 30,
+                'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+                'ACTIVITY_KEY': activity_key,
+            }
+            for _ in range(2):
+                self.assertEqual(replay([[0, 70], [0, 50, 100]], options, start), [70, None])
+            self.assertIsNone(cache.get('django_auto_logout:last_request:simulation:0'))
+            self.assertIsNone(cache.get('django_auto_logout:last_request:user:0'))
+
+        # The store of the settings keeps its cache.
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 30, 'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore'}
+        store = get_config().activity_store
+        self.assertEqual(replay([[0, 20, 45], [0, 35]]), [None, 35])
+        self.assertIs(get_config().activity_store, store)
+        self.assertIs(store.get_cache(), caches['default'])
+        self.assertIsNone(cache.get('django_auto_logout:last_request:simulation:0'))
+
+        for store_login_time in (False, True):
+            options = {
+                'IDLE_TIME': 60,
+                'SESSION_TIME': 300,
+                'STORE_LOGIN_TIME': store_login_time,
+                'ACTIVITY_STORE': 'django_auto_logout.stores.SignedCookieActivityStore',
+            }
+            self.assertEqual(replay(timelines, options), [None, None, 100, 350])
+
+            # A cookie with a forged signature doesn't keep the idle user (of the third timeline) logged in.
+            forged = f'2:{_encode_deciseconds(time() + 3600)}::forged'
+            with mock.patch('django_auto_logout.simulation._Request.COOKIES', {'auto_logout_activity': forged}):
+                self.assertEqual(replay([[], [], [70]], options), [None, None, 70])
+
+        settings.AUTO_LOGOUT = {}
+        with self.assertRaisesMessage(ImproperlyConfigured, 'Auto logout settings are not specified'):
+            replay([[1]])
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+class TestAutoLogoutConcurrency(TransactionTestCase):
+    # Requests run in other threads, so the data should be committed.
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.user = UserModel.objects.create_user('user', 'user@localhost', 'pass')
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['cart'] = [1, 2, 3]
+        session.save()
+
+    def _parallel_requests(self, count: int = 40):
+        def request(_):
+            client = self.client_class()
+            client.cookies = self.client.cookies
+            try:
+                return client.get('/login-required/').status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(executor.map(request, range(count)))
+
+    def test_write_guard_cache_activity_store(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 600,
+            'IDLE_TIME_RESOLUTION': 60,
+            'ACTIVITY_WRITE_GUARD': True,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+            'METRICS': True,
+        }
+        session_data = dict(self.client.session)
+
+        # The login is activity too: the time is stored after `IDLE_TIME_RESOLUTION`.
+        with override_clock(OffsetClock(120)), mock.patch.object(type(self.client.session), 'save') as session_save:
+            self.assertEqual(self._parallel_requests(), [200] * 40)
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['activity.writes'], 1)
+        self.assertEqual(counters['activity.skipped'], 39)
+        session_save.assert_not_called()  # the session isn't rewritten
+        self.assertEqual(dict(self.client.session), session_data)
+
+    def test_write_guard_session_activity_store(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 600,
+            'IDLE_TIME_RESOLUTION': 60,
+            'ACTIVITY_WRITE_GUARD': True,
+            'METRICS': True,
+        }
+        self.assertEqual(self._parallel_requests(), [200] * 40)
+        self.assertEqual(metrics.snapshot()['counters']['activity.writes'], 1)
+        self.assertEqual(self.client.session['cart'], [1, 2, 3])
+        self.assertIn('django_auto_logout_last_request', self.client.session)
+
+    def test_write_guard_needs_resolution(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'ACTIVITY_WRITE_GUARD': True}
+        with self.assertRaisesMessage(ImproperlyConfigured, "ACTIVITY_WRITE_GUARD needs IDLE_TIME_RESOLUTION"):
+            get_config()
+
+
+@requires_async_auth
+@override_settings(MIDDLEWARE=ASYNC_MIDDLEWARE)
+class TestAutoLogoutAsync(TestAutoLogout):
+    async def assertAsyncLoginRequiredIsOk(self):
+        resp = await self.async_client.get(self.url)
+        self.assertContains(resp, 'login required view', msg_prefix='Fine with authorized')
+        return resp
+
+    async def assertAsyncLoginRequiredRedirect(self):
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp.status_code, 302, msg='Redirect for anonymous')
+        self.assertEqual(resp['location'], f'{settings.LOGIN_URL}?next={self.url}')
+        return resp
+
+    async def test_logout_idle_time(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        await self.assertAsyncLoginRequiredRedirect()
+
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+        self.sleep(0.5)
+        await self.assertAsyncLoginRequiredIsOk()
+
+        self.sleep(1.5)
+        await self.assertAsyncLoginRequiredRedirect()
+
+    async def test_logout_session_time_with_message(self):
+        settings.AUTO_LOGOUT = {
+            'SESSION_TIME': 1,
+            'MESSAGE': 'The session has expired. Please login again to continue.',
+        }
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+
+        self.sleep(1)
+        resp = await self.assertAsyncLoginRequiredRedirect()
+        resp = await self.async_client.get(resp['location'])
+        self.assertContains(resp, settings.AUTO_LOGOUT['MESSAGE'])
+
+    async def test_custom_logout_func(self):
+        calls = []
+
+        def sync_logout(request, options):
+            calls.append('sync')
+            logout(request)
+
+        async def async_logout(request, options):
+            calls.append('async')
+            await alogout(request)
+
+        for logout_func in (sync_logout, async_logout):
+            settings.AUTO_LOGOUT = {'SESSION_TIME': 1, 'CUSTOM_LOGOUT_FUNC': logout_func}
+            self.async_client = self.async_client_class()
+            await self.async_client.aforce_login(self.user)
+            await self.assertAsyncLoginRequiredIsOk()
+
+            self.sleep(1)
+            await self.assertAsyncLoginRequiredRedirect()
+
+        self.assertEqual(calls, ['sync', 'async'])
+
+    async def test_cache_activity_store(self):
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 1,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+        self.sleep(0.5)
+        await self.assertAsyncLoginRequiredIsOk()
+
+        self.sleep(1.5)
+        await self.assertAsyncLoginRequiredRedirect()
+
+    async def test_cache_activity_store_per_user(self):
+        # The key of the user is read from the session, not from the lazy user in the event loop.
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'STORE_LOGIN_TIME': True,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+            'ACTIVITY_KEY': 'user',
+        }
+        key = f'django_auto_logout:last_request:user:{self.user.pk}'
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+        self.assertAlmostEqual(await cache.aget(key), self.clock.now().timestamp(), delta=1)
+
+        self.sleep(11)
+        await self.assertAsyncLoginRequiredRedirect()
+        self.assertIsNone(await cache.aget(key))
+
+    @requires_async_session
+    async def test_cache_activity_store_async_writes(self):
+        # The guard, the write and the delete use the async cache API, not the sync one in the event loop.
+        settings.AUTO_LOGOUT = {
+            'IDLE_TIME': 10,
+            'IDLE_TIME_RESOLUTION': 5,
+            'ACTIVITY_WRITE_GUARD': True,
+            'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore',
+        }
+        sync_call = mock.Mock(side_effect=AssertionError('sync cache call'))
+        await self.async_client.aforce_login(self.user)
+        key = f'django_auto_logout:last_request:{self.async_client.session.session_key}'
+
+        with mock.patch('django_auto_logout.stores.ActivityStore.claim_write', sync_call), \
+                mock.patch('django_auto_logout.stores.CacheActivityStore.set_value', sync_call), \
+                mock.patch('django_auto_logout.stores.CacheActivityStore.delete_value', sync_call):
+            self.sleep(6)
+            await self.assertAsyncLoginRequiredIsOk()
+            self.assertAlmostEqual(await cache.aget(key), self.clock.now().timestamp(), delta=1)
+
+            self.sleep(11)
+            await self.assertAsyncLoginRequiredRedirect()
+            self.assertIsNone(await cache.aget(key))
+
+        sync_call.assert_not_called()
+
+    async def test_store_login_time(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 10, 'SESSION_TIME': 1, 'STORE_LOGIN_TIME': True}
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+
+        self.sleep(1)
+        await self.assertAsyncLoginRequiredRedirect()
+
+    async def test_exclude_paths(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1, 'EXCLUDE_PATHS': ['/healthz/']}
+        await self.async_client.aforce_login(self.user)
+        await self.assertAsyncLoginRequiredIsOk()
+
+        self.sleep(1.5)
+        self.assertContains(await self.async_client.get('/healthz/'), 'ok')
+        await self.assertAsyncLoginRequiredRedirect()
+
+    def test_sync_request(self):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 1}
+        self.client.force_login(self.user)
+        self.assertLoginRequiredIsOk()
+
+        self.sleep(1.5)
+        self.assertLoginRequiredRedirect()
@@ -1,4 +1,5 @@
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
 from django.shortcuts import render
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.forms import AuthenticationForm
@@ -12,3 +13,7 @@ class UserLoginView(LoginView):
 @login_required
 def login_required_view(request):
     return render(request, 'login_required.html', {})
+
+
+def healthz_view(request):
+    return HttpResponse('ok')
@@ -0,0 +1,506 @@
+#!/usr/bin/env python
+"""
+Benchmarks for django-auto-logout on top of the example project.
+The results are printed as JSON to compare them between versions.
+
+Usage: ./runbenchmarks.py [--requests N] [--only matrix,session_writes,...] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from importlib import import_module
+from unittest import mock
+
+import django
+
+sys.path.append('example')
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.db.backends.utils import CursorWrapper  # noqa: E402
+from django.test import AsyncClient, Client, RequestFactory  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases  # noqa: E402
+
+from django_auto_logout import __version__, utils  # noqa: E402
+from django_auto_logout.conf import get_config  # noqa: E402
+from django_auto_logout.context_processors import (  # noqa: E402
+    LOGOUT_TIMEOUT_SCRIPT_PATTERN, _trim, auto_logout_client,
+)
+from django_auto_logout.metrics import CHECK_SECONDS, metrics  # noqa: E402
+from django_auto_logout.push import Registry  # noqa: E402
+from django_auto_logout.utils import decode_timestamp, encode_timestamp  # noqa: E402
+
+URL = '/login-required/'
+
+
+@contextmanager
+def count_session_writes():
+    """
+    Count `SessionStore.save()` calls of the configured session engine.
+    """
+    store_cls = import_module(settings.SESSION_ENGINE).SessionStore
+    original_save = store_cls.save
+    counter = {'writes': 0}
+
+    def save(self, *args, **kwargs):
+        counter['writes'] += 1
+        return original_save(self, *args, **kwargs)
+
+    store_cls.save = save
+    try:
+        yield counter
+    finally:
+        store_cls.save = original_save
+
+
+@contextmanager
+def count_queries():
+    """
+    Count DB queries in all threads (ASGI runs sync code in a thread).
+    """
+    counter = {'queries': 0}
+    original_execute, original_executemany = CursorWrapper.execute, CursorWrapper.executemany
+
+    def execute(self, *args, **kwargs):
+        counter['queries'] += 1
+        return original_execute(self, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        counter['queries'] += 1
+        return original_executemany(self, *args, **kwargs)
+
+    CursorWrapper.execute, CursorWrapper.executemany = execute, executemany
+    try:
+        yield counter
+    finally:
+        CursorWrapper.execute, CursorWrapper.executemany = original_execute, original_executemany
+
+
+SESSION_ENGINES = ('db', 'cache', 'cached_db', 'signed_cookies')
+SCENARIOS = (
+    # name, logged in, AUTO_LOGOUT
+    ('no_auto_logout', True, {}),
+    ('anonymous', False, {'IDLE_TIME': 600, 'SESSION_TIME': 3600}),
+    ('idle_time', True, {'IDLE_TIME': 600}),
+    ('session_time', True, {'SESSION_TIME': 3600}),
+    ('combined', True, {'IDLE_TIME': 600, 'SESSION_TIME': 3600}),
+)
+
+
+def bench_matrix(user, requests: int) -> list:
+    """
+    Requests per second, DB queries and session writes per request
+    for every session engine, handler (WSGI, ASGI) and configuration.
+    """
+    results = []
+    session_engine = settings.SESSION_ENGINE
+
+    for engine in SESSION_ENGINES:
+        settings.SESSION_ENGINE = f'django.contrib.sessions.backends.{engine}'
+        for handler in ('wsgi', 'asgi'):
+            for scenario, logged_in, options in SCENARIOS:
+                settings.AUTO_LOGOUT = options
+                caches['default'].clear()
+
+                if handler == 'wsgi':
+                    client = Client()
+                    if logged_in:
+                        client.force_login(user)
+                    client.get(URL)  # load middlewares
+
+                    def run() -> None:
+                        for _ in range(requests):
+                            client.get(URL)
+                else:
+                    client = AsyncClient()
+                    if logged_in:
+                        client.force_login(user)
+
+                    async def arun() -> None:
+                        for _ in range(requests):
+                            await client.get(URL)
+
+                    asyncio.run(client.get(URL))
+
+                    def run() -> None:
+                        asyncio.run(arun())
+
+                with count_queries() as queries, count_session_writes() as writes:
+                    started = time.perf_counter()
+                    run()
+                    duration = time.perf_counter() - started
+
+                results.append({
+                    'session_engine': engine,
+                    'handler': handler,
+                    'scenario': scenario,
+                    'requests_per_second': round(requests / duration, 1),
+                    'queries_per_request': round(queries['queries'] / requests, 3),
+                    'session_writes_per_request': round(writes['writes'] / requests, 3),
+                })
+
+    settings.SESSION_ENGINE = session_engine
+    return results
+
+
+def bench_session_writes(user, requests: int) -> list:
+    """
+    Session writes with and without `IDLE_TIME_RESOLUTION` and with the cache activity store.
+    """
+    results = []
+    for name, options in (
+        ('IDLE_TIME_RESOLUTION=None', {}),
+        ('IDLE_TIME_RESOLUTION=60', {'IDLE_TIME_RESOLUTION': 60}),
+        ('ACTIVITY_STORE=CacheActivityStore', {'ACTIVITY_STORE': 'django_auto_logout.stores.CacheActivityStore'}),
+    ):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, **options}
+        client = Client()
+        client.force_login(user)
+
+        with count_session_writes() as counter:
+            for _ in range(requests):
+                client.get(URL)
+
+        results.append({'options': name, 'requests': requests, 'session_writes': counter['writes']})
+
+    return results
+
+
+def bench_cache_writes(user, requests: int) -> list:
+    """
+    Cache writes of the cache activity store with and without buffering.
+    """
+    results = []
+    cache_cls = type(caches['default'])
+    counter = {'writes': 0}
+    original_set, original_set_many = cache_cls.set, cache_cls.set_many
+
+    def count_set(self, *args, **kwargs):
+        counter['writes'] += 1
+        return original_set(self, *args, **kwargs)
+
+    def count_set_many(self, *args, **kwargs):
+        counter['writes'] += 1
+        return original_set_many(self, *args, **kwargs)
+
+    cache_cls.set, cache_cls.set_many = count_set, count_set_many
+    try:
+        for store in ('CacheActivityStore', 'BufferedCacheActivityStore'):
+            settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'ACTIVITY_STORE': f'django_auto_logout.stores.{store}'}
+            client = Client()
+            client.force_login(user)
+            counter['writes'] = 0
+
+            for _ in range(requests):
+                client.get(URL)
+            if hasattr(get_config().activity_store, 'flush'):
+                get_config().activity_store.flush()
+
+            results.append({'activity_store': store, 'requests': requests, 'cache_writes': counter['writes']})
+    finally:
+        cache_cls.set, cache_cls.set_many = original_set, original_set_many
+
+    return results
+
+
+def bench_asgi_latency(user, requests: int) -> list:
+    """
+    Per-request latency under ASGI of `auto_logout` (a thread hop for the whole chain)
+    and of the native async `async_auto_logout`.
+    """
+    results = []
+    middleware = settings.MIDDLEWARE
+    settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'SESSION_TIME': 3600}
+
+    async def run() -> float:
+        client = AsyncClient()
+        await client.aforce_login(user)
+        await client.get(URL)  # load middlewares
+
+        started = time.perf_counter()
+        for _ in range(requests):
+            await client.get(URL)
+        return (time.perf_counter() - started) / requests
+
+    for name in ('auto_logout', 'async_auto_logout'):
+        settings.MIDDLEWARE = [m for m in middleware if not m.startswith('django_auto_logout.')]
+        settings.MIDDLEWARE.append(f'django_auto_logout.middleware.{name}')
+        latency = asyncio.run(run())
+        results.append({'middleware': name, 'ms_per_request': round(latency * 1000, 3)})
+
+    settings.MIDDLEWARE = middleware
+    return results
+
+
+def bench_excluded_queries(user, requests: int) -> list:
+    """
+    DB queries per request to a health check with and without `EXCLUDE_PATHS`.
+    """
+    results = []
+    for exclude_paths in (None, ['/healthz/']):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'EXCLUDE_PATHS': exclude_paths}
+        client = Client()
+        client.force_login(user)
+
+        with count_queries() as queries:
+            for _ in range(requests):
+                client.get('/healthz/')
+
+        results.append({'exclude_paths': exclude_paths, 'queries_per_request': queries['queries'] / requests})
+
+    return results
+
+
+def bench_timestamp_format(user, requests: int) -> list:
+    """
+    Parse time and JSON size of the last request time in the session for every `TIMESTAMP_FORMAT`.
+    """
+    results = []
+    for timestamp_format in ('iso', 'seconds', 'deciseconds'):
+        value = encode_timestamp(now(), timestamp_format)
+        started = time.perf_counter()
+        for _ in range(requests * 100):
+            decode_timestamp(value)
+        parse_time = (time.perf_counter() - started) / (requests * 100)
+
+        results.append({
+            'timestamp_format': timestamp_format,
+            'us_to_parse': round(parse_time * 10 ** 6, 3),
+            'json_bytes': len(json.dumps(value)),
+        })
+
+    return results
+
+
+def bench_render(user, requests: int) -> list:
+    """
+    Time of `auto_logout_client` per render: the inline script (trimmed once, as now and per render, as before)
+    and the static script.
+    """
+    results = []
+    request = RequestFactory().get(URL)
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    renders = requests * 50
+
+    def per_render(func) -> float:
+        started = time.perf_counter()
+        for _ in range(renders):
+            func(request)
+        return (time.perf_counter() - started) / renders
+
+    def trim_per_render(request):
+        ctx = auto_logout_client(request)
+        _trim(LOGOUT_TIMEOUT_SCRIPT_PATTERN % f"at=Date.now()+Math.max({ctx['seconds_until_idle_end']},0)*1000+999;")
+
+    for name, client_script, func in (
+        ('inline, trimmed per render', 'inline', trim_per_render),
+        ('inline', 'inline', auto_logout_client),
+        ('static', 'static', auto_logout_client),
+    ):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'REDIRECT_TO_LOGIN_IMMEDIATELY': True, 'CLIENT_SCRIPT': client_script}
+        results.append({'client_script': name, 'us_per_render': round(per_render(func) * 10 ** 6, 3)})
+
+    return results
+
+
+def bench_passive_matcher(user, requests: int) -> list:
+    """
+    Time of the check if a request is activity (`PASSIVE_*` settings).
+    """
+    results = []
+    request = RequestFactory().get(URL)
+    checks = requests * 500
+
+    for name, options in (
+        ('default', {}),
+        ('headers and methods', {'PASSIVE_HEADERS': ['X-Background-Request'], 'PASSIVE_METHODS': ['HEAD', 'OPTIONS']}),
+        ('URL names', {'PASSIVE_URL_NAMES': ['healthz']}),
+    ):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, **options}
+        is_passive = get_config().is_passive
+        started = time.perf_counter()
+        for _ in range(checks):
+            is_passive(request)
+        per_request = (time.perf_counter() - started) / checks
+        results.append({'passive': name, 'us_per_request': round(per_request * 10 ** 6, 3)})
+
+    return results
+
+
+def bench_push(user, requests: int) -> list:
+    """
+    Delivery of events to idle clients waiting on one event loop.
+    """
+    clients = requests * 50
+    registry = Registry(max_sessions=clients)
+
+    async def run() -> float:
+        after = [registry.open(f'session-{i}') for i in range(clients)]
+        waiters = [asyncio.ensure_future(registry.wait(f'session-{i}', after[i], 60)) for i in range(clients)]
+        await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        for i in range(clients):
+            registry.publish(f'session-{i}', 'deadline', {'deadline': i})
+        await asyncio.gather(*waiters)
+        return time.perf_counter() - started
+
+    duration = asyncio.run(run())
+    return [{'idle_clients': clients, 'ms_to_deliver_to_all': round(duration * 1000, 1)}]
+
+
+def bench_bulk_deadlines(user, requests: int) -> list:
+    """
+    `bulk_logout_deadlines` for many sessions with NumPy (if it's installed) and without it.
+    """
+    results = []
+    sessions = requests * 1000
+    current_time = now()
+    current = current_time.timestamp()
+    login_times = [current - i % 7200 for i in range(sessions)]
+    last_requests = [current - i % 900 for i in range(sessions)]
+
+    for numpy in dict.fromkeys((utils.numpy, None)):
+        with mock.patch.object(utils, 'numpy', numpy):
+            started = time.perf_counter()
+            utils.bulk_logout_deadlines(login_times, last_requests, current_time, 3600, 600, 300)
+            duration = time.perf_counter() - started
+
+        results.append({
+            'numpy': numpy is not None,
+            'sessions': sessions,
+            'sessions_per_second': round(sessions / duration),
+        })
+
+    return results
+
+
+def bench_heartbeat(user, requests: int) -> list:
+    """
+    Requests per second, DB queries and session writes per request of the `heartbeat` view
+    against a page, with and without `IDLE_TIME_RESOLUTION`.
+    """
+    results = []
+    for resolution in (None, 60):
+        settings.AUTO_LOGOUT = {'IDLE_TIME': 600, 'IDLE_TIME_RESOLUTION': resolution}
+        for name, url, method in (('page', URL, 'get'), ('heartbeat', '/auto-logout/heartbeat/', 'post')):
+            client = Client()
+            client.force_login(user)
+            send = getattr(client, method)
+            send(url)
+
+            with count_queries() as queries, count_session_writes() as writes:
+                started = time.perf_counter()
+                for _ in range(requests):
+                    send(url)
+                duration = time.perf_counter() - started
+
+            results.append({
+                'request': name,
+                'idle_time_resolution': resolution,
+                'requests_per_second': round(requests / duration, 1),
+                'queries_per_request': round(queries['queries'] / requests, 3),
+                'session_writes_per_request': round(writes['writes'] / requests, 3),
+            })
+
+    return results
+
+
+def bench_deadline_cache(user, requests: int) -> list:
+    """
+    Time of the middleware checks per request and DB queries with and without `DEADLINE_CACHE_SIZE`:
+    requests before the cached deadline don't decode the times (nor load the session and the user).
+    """
+    results = []
+    for name, options in (
+        ('idle_and_session_time', {'IDLE_TIME': 600, 'IDLE_TIME_RESOLUTION': 60, 'SESSION_TIME': 3600}),
+        ('store_login_time', {
+            'IDLE_TIME': 600, 'IDLE_TIME_RESOLUTION': 60, 'SESSION_TIME': 3600, 'STORE_LOGIN_TIME': True,
+        }),
+    ):
+        for cache_size in (None, 10000):
+            settings.AUTO_LOGOUT = {**options, 'DEADLINE_CACHE_SIZE': cache_size, 'METRICS': True}
+            client = Client()
+            client.force_login(user)
+            client.get(URL)
+            metrics.reset()
+
+            with count_queries() as queries:
+                started = time.perf_counter()
+                for _ in range(requests):
+                    client.get(URL)
+                duration = time.perf_counter() - started
+
+            histogram = metrics.snapshot()['histograms'][CHECK_SECONDS]
+            results.append({
+                'options': name,
+                'deadline_cache_size': cache_size,
+                'check_us': round(histogram['sum'] / histogram['count'] * 1e6, 2),
+                'requests_per_second': round(requests / duration, 1),
+                'queries_per_request': round(queries['queries'] / requests, 3),
+            })
+
+    metrics.reset()
+    return results
+
+
+BENCHMARKS = {
+    'matrix': bench_matrix,
+    'session_writes': bench_session_writes,
+    'cache_writes': bench_cache_writes,
+    'asgi_latency': bench_asgi_latency,
+    'excluded_queries': bench_excluded_queries,
+    'timestamp_format': bench_timestamp_format,
+    'render': bench_render,
+    'passive_matcher': bench_passive_matcher,
+    'push': bench_push,
+    'bulk_deadlines': bench_bulk_deadlines,
+    'heartbeat': bench_heartbeat,
+    'deadline_cache': bench_deadline_cache,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help="Comma-separated benchmarks to run.")
+    parser.add_argument('--output', help="Write the JSON to the file instead of stdout.")
+    args = parser.parse_args()
+
+    # Debug logs of the example project would be measured too.
+    logging.disable(logging.WARNING)
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        user = get_user_model().objects.create_user('user', 'user@localhost', 'pass')
+        results = {
+            'django_auto_logout': __version__,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'benchmarks': {name: BENCHMARKS[name](user, args.requests) for name in args.only.split(',')},
+        }
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()